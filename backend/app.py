@@ -1,21 +1,112 @@
-import os, time, json
-from typing import Dict, Any, List
-from fastapi import FastAPI, HTTPException
+import os, sys, time, json, hmac, base64, hashlib, asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from contextvars import ContextVar
+from typing import Dict, Any, List, Literal, Optional
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 
-from db import run_query, ensure_db, get_schema, schema_json
-from forecast import maybe_forecast
+from db import run_query, read_snapshot, ensure_db, ensure_indexes, pool_stats, current_pool, close_pool, table_stamp, DB_POOL_SIZE, QueryBudgetExceeded, QueryNotAllowed
+from planguard import check_plan, PLAN_GUARD
+from catalog import get_catalog, DIMENSION_TABLES
+from plancache import plan_cache
+from cache import result_cache, query_registry, cache_key, estimate_rows_bytes, normalize_sql
 from sqlgen import generate_sql_and_chart
-from llm_groq import USE_LLM, parse_intent, make_sql, write_insight, repair_sql
+import rollup
+from ingest import ingest, IngestError, INGEST_BATCH_ORDERS
+from metrics import metrics, stage, timed, start_trace, current_trace, set_path, server_timing
+from llm_groq import aparse_intent, amake_sql, awrite_insight, arepair_sql
 
 load_dotenv()
 
+try:
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 ROW_LIMIT = int(os.getenv("ROW_LIMIT", "2000"))
 DEFAULT_PERIODS = int(os.getenv("FORECAST_PERIODS", "3"))
+MAX_INFLIGHT_CHATS = int(os.getenv("MAX_INFLIGHT_CHATS", "512"))
+MAX_BATCH_QUESTIONS = int(os.getenv("MAX_BATCH_QUESTIONS", "50"))
+# Identical concurrent /chat requests share one answer.
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() in ("1","true","yes")
+# >0: with USE_LLM, questions a template recognizes also run the heuristic path, and the
+# LLM answer is used only if it is complete within this many ms.
+LLM_HEDGE_MS = int(os.getenv("LLM_HEDGE_MS", "0"))
+# A losing LLM chain keeps running this long (at most) so its plan and SQL still get cached.
+LLM_HEDGE_DETACH_S = float(os.getenv("LLM_HEDGE_DETACH_S", "30"))
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "500"))
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", "2"))
+# Block startup on seeding/indexes/rollup (old behaviour) instead of warming up behind /readyz.
+BLOCKING_STARTUP = os.getenv("BLOCKING_STARTUP", "false").lower() in ("1","true","yes")
+# Rows embedded in a /chat reply; the rest (up to ROW_LIMIT and beyond) is paged via /query/{id}/rows.
+TABLE_INLINE_ROWS = int(os.getenv("TABLE_INLINE_ROWS", str(ROW_LIMIT)))
+PAGE_MAX_ROWS = int(os.getenv("PAGE_MAX_ROWS", "1000"))
+# Heuristic templates: sql (SQLite, result cache) | numpy (engine.py column arrays, no SQL).
+HEURISTIC_ENGINE = os.getenv("HEURISTIC_ENGINE", "sql").lower()
+# POST /ingest is disabled unless a token is set; clients send it as X-Ingest-Token.
+INGEST_TOKEN = os.getenv("INGEST_TOKEN", "")
+MAX_INGEST_ORDERS = int(os.getenv("MAX_INGEST_ORDERS", "50000"))
+
+# Sized to the read pool so DB jobs never queue on a connection checkout.
+db_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+forecast_executor = ThreadPoolExecutor(max_workers=FORECAST_WORKERS, thread_name_prefix="forecast")
+# One writer at a time, off the read pool's executor so ingests never take a reader's slot.
+ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+
+def forecaster():
+    # Imported on first use: numpy (and pandas/Prophet when enabled) stay out of worker boot.
+    import forecast
+    return forecast
+
+def run_forecast(*args, **kwargs):
+    return forecaster().forecast_series(*args, **kwargs)
+
+def forecast_cache_stats() -> dict:
+    mod = sys.modules.get("forecast")
+    return mod.cache_stats() if mod else {"hits": 0, "misses": 0, "entries": 0, "loaded": False}
 
-app = FastAPI(title="Northwind Sales Chatbot API", version="2.1.0")
+def vector_engine():
+    # Loaded (and numpy imported) only when HEURISTIC_ENGINE=numpy.
+    import engine
+    return engine.get_engine()
+
+def warm_up(_app: FastAPI):
+    # Seed, index and build the rollup before /readyz reports ready, instead of on the first request.
+    start = time.time()
+    ensure_db()
+    _app.state.indexes = ensure_indexes()
+    rollup.ensure_fresh()
+    get_catalog()
+    if HEURISTIC_ENGINE == "numpy":
+        vector_engine()
+    forecast = forecaster()
+    if forecast.FORECAST_BACKEND == "prophet":
+        forecast.prophet_service.warm()
+    _app.state.startup_ms = int((time.time() - start) * 1000)
+    print(f"Warm-up finished in {_app.state.startup_ms} ms")
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    _app.state.warmup = asyncio.ensure_future(_off_loop(db_executor, warm_up, _app))
+    if BLOCKING_STARTUP:
+        await _app.state.warmup
+    yield
+    # Warm-up may still be importing forecast when a short-lived process shuts down.
+    service = getattr(sys.modules.get("forecast"), "prophet_service", None)
+    if service:
+        service.shutdown()
+    close_pool()
+
+app = FastAPI(title="Northwind Sales Chatbot API", version="2.1.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -23,17 +114,74 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def request_timer(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe("http_request_duration_seconds", time.perf_counter() - start,
+                    route=getattr(route, "path", "unmatched"), method=request.method, status=response.status_code)
+    return response
+
 class ChatReq(BaseModel):
     question: str
+    no_cache: bool = False
+    # "columnar": table sent once as column arrays, chart fields reference them by name.
+    format: Literal["rows", "columnar"] = "rows"
 
 @app.get("/healthz")
 def health():
     ensure_db()
     return {"status":"ok"}
 
+@app.get("/readyz")
+async def ready():
+    # Readiness, unlike /healthz (liveness): 503 until warm-up is done and the read pool answers.
+    task = getattr(app.state, "warmup", None)
+    if task is None or not task.done():
+        return JSONResponse({"status": "starting"}, status_code=503)
+    if task.exception() is not None:
+        return JSONResponse({"status": "failed", "error": str(task.exception())}, status_code=503)
+    try:
+        await _off_loop(db_executor, run_query, "SELECT 1")
+    except Exception as e:
+        return JSONResponse({"status": "unavailable", "error": str(e)}, status_code=503)
+    return {"status": "ready", "startup_ms": getattr(app.state, "startup_ms", None)}
+
+@app.get("/stats")
+def stats():
+    return {"db_pool": pool_stats(), "result_cache": result_cache.stats(), "plan_cache": plan_cache.stats(),
+            "query_registry": query_registry.stats(),
+            "forecast_cache": forecast_cache_stats(),
+            "engine": sys.modules["engine"].stats() if "engine" in sys.modules else None,
+            "rollup": rollup.stats(), "indexes": getattr(app.state, "indexes", None), "inflight_chats": _inflight}
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@metrics.collector
+def _scrape():
+    # A scrape must not seed the DB or open the pool: zeros until the first read creates it.
+    pool = current_pool()
+    pool = pool.stats() if pool is not None else {}
+    for key in ("in_use", "idle", "checkouts", "waits", "timeouts", "discarded", "generation", "swaps"):
+        yield "db_pool", "gauge", "Read connection pool counters.", {"stat": key}, pool.get(key, 0)
+    for name, st in (("result", result_cache.stats()), ("plan", plan_cache.stats()), ("forecast", forecast_cache_stats())):
+        yield "cache_hits_total", "counter", "Cache hits.", {"cache": name}, st["hits"]
+        yield "cache_misses_total", "counter", "Cache misses.", {"cache": name}, st["misses"]
+        lookups = st["hits"] + st["misses"]
+        yield "cache_hit_ratio", "gauge", "Cache hit ratio since start.", {"cache": name}, st["hits"] / lookups if lookups else 0
+    yield "inflight_chats", "gauge", "Chats currently being answered.", {}, _inflight
+
 @app.get("/schema")
-def schema():
-    return get_schema()
+def schema(detail: bool = False):
+    catalog = get_catalog()
+    return catalog.describe() if detail else catalog.columns()
+
+@app.get("/query/{query_id}/rows")
+async def query_rows(query_id: str, cursor: str | None = None, limit: int = 500):
+    return await _off_loop(db_executor, fetch_page, query_id, cursor, limit)
 
 @app.get("/examples")
 def examples():
@@ -48,16 +196,109 @@ def select_only(sql: str):
     if not sql.strip().lower().startswith("select"):
         raise HTTPException(status_code=400, detail="Only SELECT queries are allowed.")
 
-def exec_sql(sql: str):
+def governor_error(e: Exception) -> HTTPException:
+    # Structured 4xx so clients (and the LLM repair prompt) see which budget or rule tripped.
+    status = 422 if isinstance(e, QueryBudgetExceeded) else 403
+    return HTTPException(status_code=status, detail=e.to_dict())
+
+def exec_sql(sql: str, use_cache: bool = True, generated: bool = False):
+    try:
+        return _exec_sql(sql, use_cache, generated)
+    except (QueryBudgetExceeded, QueryNotAllowed) as e:
+        print("Query governor:", e, "for", " ".join(sql.split())[:200])
+        raise governor_error(e)
+
+def exec_template(plan: Dict[str, Any], sql: str, use_cache: bool):
+    # Heuristic templates can skip SQLite; whatever the engine cannot answer runs as SQL.
+    start = time.time()
+    engine = vector_engine() if HEURISTIC_ENGINE == "numpy" else None
+    result = engine.answer(plan.get("template"), plan.get("limit")) if engine else None
+    if result is None:
+        return exec_sql(sql, use_cache)
+    cols, rows = result
+    truncated = len(rows) > ROW_LIMIT
+    if truncated:
+        del rows[ROW_LIMIT:]
+    return cols, rows, int((time.time() - start) * 1000), truncated, {"cached": False, "engine": "numpy"}
+
+def guard_reject(guard: Dict[str, Any], generated: bool):
+    # Only LLM-generated SQL is rejected; the heuristic templates are trusted.
+    if generated and PLAN_GUARD == "reject" and guard.get("plan_issues"):
+        raise HTTPException(status_code=422, detail={"error": "plan_rejected", **guard})
+
+def _exec_sql(sql: str, use_cache: bool, generated: bool):
     select_only(sql)
     start = time.time()
-    cols, rows = run_query(sql)
-    truncated = False
-    if len(rows) > ROW_LIMIT:
-        rows = rows[:ROW_LIMIT]
-        truncated = True
+    key = cache_key(sql)
+    epoch, stamp = table_stamp(sql)
+    hit = result_cache.get(key, epoch, stamp) if use_cache else None
+    if hit is not None:
+        cols, rows, truncated, guard = hit
+        # The same SQL may have been cached from a trusted template; the guard still applies.
+        guard_reject(guard, generated)
+    else:
+        guard = check_plan(sql)
+        if guard.get("plan_issues"):
+            print("Query plan guard:", guard["plan_issues"], "for", " ".join(sql.split())[:200])
+        guard_reject(guard, generated)
+        # One row past the limit is enough to know the result was truncated.
+        cols, rows = run_query(sql, limit=ROW_LIMIT + 1)
+        truncated = len(rows) > ROW_LIMIT
+        if truncated:
+            del rows[ROW_LIMIT:]
+        if use_cache:
+            result_cache.put(key, (cols, rows, truncated, guard), epoch, estimate_rows_bytes(cols, rows), stamp)
     elapsed_ms = int((time.time() - start) * 1000)
-    return cols, rows, elapsed_ms, truncated
+    return cols, rows, elapsed_ms, truncated, {"cached": hit is not None, **guard}
+
+# ---- Result paging ----
+# A query id is the hash of the normalized SQL, held in a bounded LRU + TTL registry of this
+# worker (with several workers, page requests need the same worker). Cursors are opaque
+# offsets into the registered statement.
+
+def register_query(sql: str) -> str:
+    sql = normalize_sql(sql)
+    query_id = hashlib.sha1(sql.encode("utf-8")).hexdigest()[:16]
+    query_registry.put(query_id, sql, nbytes=len(sql))
+    return query_id
+
+def encode_cursor(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"o": offset}).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str | None) -> int:
+    if not cursor:
+        return 0
+    try:
+        offset = int(json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))["o"])
+    except Exception:
+        offset = -1
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return offset
+
+def fetch_page(query_id: str, cursor: str | None, limit: int) -> Dict[str, Any]:
+    sql = query_registry.get(query_id)
+    if sql is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired query id.")
+    offset = decode_cursor(cursor)
+    limit = max(1, min(limit, PAGE_MAX_ROWS))
+    start = time.time()
+    try:
+        cols, rows = run_query(f"SELECT * FROM ({sql}) LIMIT ? OFFSET ?", (limit + 1, offset), limit=limit + 1)
+    except (QueryBudgetExceeded, QueryNotAllowed) as e:
+        raise governor_error(e)
+    more = len(rows) > limit
+    return {"query_id": query_id, "columns": cols, "rows": rows[:limit], "offset": offset,
+            "next_cursor": encode_cursor(offset + limit) if more else None,
+            "elapsed_ms": int((time.time() - start) * 1000)}
+
+def table_page(sql: str, cols: List[str], rows: List[List[Any]], truncated: bool, inline_rows: int = TABLE_INLINE_ROWS):
+    """Inline table payload plus paging meta when the result does not fit inline."""
+    if not truncated and len(rows) <= inline_rows:
+        return {"columns": cols, "rows": rows}, {}
+    inline = rows[:inline_rows]
+    return {"columns": cols, "rows": inline}, {"query_id": register_query(sql),
+                                               "next_cursor": encode_cursor(len(inline))}
 
 def choose_chart(plan: Dict[str, Any], columns: List[str]) -> Dict[str, Any]:
     intent = (plan or {}).get("intent") or "aggregate"
@@ -80,22 +321,37 @@ def choose_chart(plan: Dict[str, Any], columns: List[str]) -> Dict[str, Any]:
     chart["xField"] = columns[0]; chart["yField"] = columns[-1]; chart["title"] = f"{chart['yField']} by {chart['xField']}"
     return chart
 
-def rows_to_chartdata(columns: List[str], rows: List[List[Any]], x: str, y: str):
+def chart_columns(columns: List[str], x: str, y: str):
     idx = {c.lower(): i for i, c in enumerate(columns)}
     if x.lower() not in idx or y.lower() not in idx:
         raise HTTPException(status_code=400, detail=f"Chart fields not in result. Got columns: {columns}")
-    data = []
-    for r in rows:
-        data.append({x: r[idx[x.lower()]], y: r[idx[y.lower()]]})
-    return data
-
-def compute_metrics(chart_data, x, y):
-    total = sum(float(d.get(y,0) or 0) for d in chart_data)
-    ranked = sorted(chart_data, key=lambda d: float(d.get(y,0) or 0), reverse=True)
-    top = ranked[0] if ranked else None
-    out = {"total": total, "top": top, "k": len(chart_data)}
+    return idx[x.lower()], idx[y.lower()]
+
+def rows_to_chartdata(columns: List[str], rows: List[List[Any]], x: str, y: str):
+    xi, yi = chart_columns(columns, x, y)
+    return [{x: r[xi], y: r[yi]} for r in rows]
+
+def chart_payload(chart: Dict[str, Any], columns: List[str], rows: List[List[Any]], columnar: bool):
+    """Chart event payload plus the x/y series it plots. Columnar charts carry no data of their
+    own: their fields name columns of the table, which is sent once."""
+    xi, yi = chart_columns(columns, chart["xField"], chart["yField"])
+    xs, ys = [r[xi] for r in rows], [r[yi] for r in rows]
+    if columnar:
+        return {**chart, "xField": columns[xi], "yField": columns[yi]}, xs, ys
+    return {**chart, "data": [{chart["xField"]: a, chart["yField"]: b} for a, b in zip(xs, ys)]}, xs, ys
+
+def compute_metrics(xs: List[Any], ys: List[Any], x: str, y: str):
+    # Single pass for the total and the top item; no need to sort the series.
+    total, best, best_v = 0.0, None, 0.0
+    for i, v in enumerate(ys):
+        v = float(v or 0)
+        total += v
+        if best is None or v > best_v:
+            best, best_v = i, v
+    top = {x: xs[best], y: ys[best]} if best is not None else None
+    out = {"total": total, "top": top, "k": len(ys)}
     if top and total>0:
-        out["top_share_pct"] = round(100.0*float(top[y])/total, 1)
+        out["top_share_pct"] = round(100.0*best_v/total, 1)
     return out
 
 class ChartSpec(BaseModel):
@@ -112,54 +368,479 @@ class ApiReply(BaseModel):
     table: dict | None = None
     meta: dict | None = None
 
-@app.post("/chat", response_model=ApiReply)
-def chat(req: ChatReq):
-    ensure_db()
-    scheme = schema_json()
-    used_llm = False
+# ---- Async pipeline ----
+# Blocking work (SQLite, forecasting) runs in bounded executors so the event loop only
+# waits on network I/O; admission control sheds load instead of queueing without limit.
 
-    if os.getenv("USE_LLM", "false").lower() in ("1","true","yes"):
+def _off_loop(executor: ThreadPoolExecutor, fn, *args, **kwargs):
+    return asyncio.get_running_loop().run_in_executor(executor, partial(fn, *args, **kwargs))
+
+_inflight = 0
+
+@asynccontextmanager
+async def admission():
+    global _inflight
+    if _inflight >= MAX_INFLIGHT_CHATS:
+        raise HTTPException(status_code=503, detail="Server busy, retry shortly.", headers={"Retry-After": "1"})
+    _inflight += 1
+    try:
+        yield
+    finally:
+        _inflight -= 1
+
+# Queries and forecasts go through these two hooks; inside /chat/batch they are shared
+# between questions (see QueryBatch), otherwise they go straight to the executors.
+_batch: ContextVar[Optional["QueryBatch"]] = ContextVar("batch", default=None)
+
+async def run_sql(sql: str, fn, *args, **kwargs):
+    batch = _batch.get()
+    if batch is None:
+        return await _off_loop(db_executor, fn, *args, **kwargs)
+    return await batch.query((fn.__name__, normalize_sql(sql)), partial(fn, *args, **kwargs))
+
+async def forecast_points(xs: list, ys: list, x_field: str, y_field: str, periods: int):
+    batch = _batch.get()
+    if batch is None:
+        return await _off_loop(forecast_executor, run_forecast, xs, ys, x_field, y_field, periods=periods)
+    return await batch.forecast(xs, ys, x_field, y_field, periods)
+
+# Both paths are async generators of (event, payload) pairs in render order:
+# plan, sql, table, chart, forecast?, insight, meta. /chat collects them into one
+# ApiReply; /chat/stream forwards them as NDJSON so the client can paint early.
+
+async def llm_events(req: ChatReq):
+    set_path("llm")
+    with stage("catalog"):
+        catalog = await _off_loop(db_executor, get_catalog)
+    fp = catalog.fingerprint
+    use_cache = not req.no_cache
+    with stage("plan_cache"):
+        cached_plan = await _off_loop(db_executor, plan_cache.get, "plan", req.question, fp) if use_cache else None
+    plan = cached_plan or await timed("intent", aparse_intent(req.question, catalog.compact()))
+    yield "plan", {"plan": plan, "used_llm": True}
+    scheme = catalog.compact(catalog.tables_for(plan))
+    with stage("plan_cache"):
+        cached_sql = await _off_loop(db_executor, plan_cache.get, "sql", req.question, fp) if use_cache else None
+    sql = cached_sql or (await timed("make_sql", amake_sql(plan, scheme))).strip()
+    try:
+        with stage("query"):
+            cols, rows, elapsed, truncated, info = await run_sql(sql, exec_sql, sql, use_cache, generated=True)
+    except Exception as e:
+        if cached_sql is not None:
+            # Don't serve the failing SQL again; the repaired SQL is cached below if it runs.
+            await _off_loop(db_executor, plan_cache.discard, "sql", req.question, fp)
+        fixed = (await timed("repair_sql", arepair_sql(str(e), sql, scheme))).strip()
+        with stage("query"):
+            cols, rows, elapsed, truncated, info = await run_sql(fixed, exec_sql, fixed, use_cache, generated=True)
+        sql = fixed
+    yield "sql", {"sql": sql}
+    # Only plans whose SQL actually ran are persisted; repaired SQL replaces the original.
+    if cached_plan is None:
+        await _off_loop(db_executor, plan_cache.put, "plan", req.question, fp, plan)
+    if sql != cached_sql:
+        await _off_loop(db_executor, plan_cache.put, "sql", req.question, fp, sql)
+    info["plan_cached"] = cached_plan is not None
+    info["sql_cached"] = sql == cached_sql
+    columnar = req.format == "columnar"
+    chart, xs, ys = chart_payload(choose_chart(plan, cols), cols, rows, columnar)
+    table, paging = await _off_loop(db_executor, table_page, sql, cols, rows, truncated,
+                                    len(rows) if columnar else TABLE_INLINE_ROWS)
+    yield "table", table
+    yield "chart", chart
+    is_forecast = str(plan.get("intent")) == "forecast"
+    # The insight only needs metrics over the actuals, so it runs alongside the forecast fit.
+    summary = compute_metrics(xs, ys, chart["xField"], chart["yField"])
+    insight_task = asyncio.ensure_future(timed("insight", awrite_insight(json.dumps(summary), json.dumps(rows[:5]))))
+    try:
+        if is_forecast:
+            periods = int(plan.get("periods") or DEFAULT_PERIODS)
+            with stage("forecast"):
+                points = await forecast_points(xs, ys, chart["xField"], chart["yField"], periods)
+            yield "forecast", points
         try:
-            plan = parse_intent(req.question, scheme)
-            sql = make_sql(plan, scheme).strip()
-            try:
-                cols, rows, elapsed, truncated = exec_sql(sql)
-            except Exception as e:
-                fixed = repair_sql(str(e), sql, scheme).strip()
-                cols, rows, elapsed, truncated = exec_sql(fixed)
-                sql = fixed
-            used_llm = True
-            chart = choose_chart(plan, cols)
-            data = rows_to_chartdata(cols, rows, chart["xField"], chart["yField"])
-            if str(plan.get("intent")) == "forecast":
-                periods = int(plan.get("periods") or os.getenv("FORECAST_PERIODS","3"))
-                data = maybe_forecast(data, chart["xField"], chart["yField"], periods=periods)
-            metrics = compute_metrics(data, chart["xField"], chart["yField"])
-            try:
-                insight = write_insight(json.dumps(metrics), json.dumps(rows[:5]))
-            except Exception:
-                insight = f"Returned {len(rows)} rows."
-            return {
-                "chart": {**chart, "data": data},
-                "insight": insight,
-                "table": {"columns": cols, "rows": rows},
-                "meta": {"sql": sql, "elapsed_ms": elapsed, "row_count": len(rows), "forecast": plan.get("intent")=="forecast", "used_llm": used_llm, "truncated": truncated},
-            }
-        except Exception:
-            pass
-
-    # Heuristic fallback
-    plan = generate_sql_and_chart(req.question)
+            insight = await insight_task
+        except Exception as e:
+            print("Insight generation failed:", e)
+            metrics.inc("fallbacks_total", reason="insight_failed")
+            insight = f"Returned {len(rows)} rows."
+    finally:
+        insight_task.cancel()
+    yield "insight", insight
+    yield "meta", {"sql": sql, "elapsed_ms": elapsed, "row_count": len(rows), "forecast": is_forecast,
+                   "used_llm": True, "truncated": truncated, **paging, **info}
+
+async def heuristic_events(req: ChatReq):
+    set_path("heuristic")
+    with stage("rollup"):
+        use_rollup = await _off_loop(db_executor, rollup.ensure_fresh)
+    plan = generate_sql_and_chart(req.question, rollup=use_rollup)
     sql = plan["sql"].strip()
-    cols, rows, elapsed, truncated = exec_sql(sql)
-    chart = plan["chart"]
-    data = rows_to_chartdata(cols, rows, chart["xField"], chart["yField"])
+    yield "plan", {"plan": {"forecast": plan.get("forecast", False), "periods": plan.get("periods"),
+                            "template": plan.get("template")}, "used_llm": False}
+    yield "sql", {"sql": sql}
+    with stage("query"):
+        cols, rows, elapsed, truncated, info = await run_sql(sql, exec_template, plan, sql, not req.no_cache)
+    columnar = req.format == "columnar"
+    chart, xs, ys = chart_payload(plan["chart"], cols, rows, columnar)
+    table, paging = await _off_loop(db_executor, table_page, sql, cols, rows, truncated,
+                                    len(rows) if columnar else TABLE_INLINE_ROWS)
+    yield "table", table
+    yield "chart", chart
     if plan.get("forecast"):
-        data = maybe_forecast(data, chart["xField"], chart["yField"], periods=plan.get("periods", 3))
-    insight = plan.get("insight") or f"Returned {len(rows)} rows."
-    return {
-        "chart": {**chart, "data": data},
-        "insight": insight,
-        "table": {"columns": cols, "rows": rows},
-        "meta": {"sql": sql, "elapsed_ms": elapsed, "row_count": len(rows), "forecast": plan.get("forecast", False), "used_llm": used_llm, "truncated": truncated},
-    }
\ No newline at end of file
+        with stage("forecast"):
+            points = await forecast_points(xs, ys, chart["xField"], chart["yField"], plan.get("periods", 3))
+        yield "forecast", points
+    yield "insight", plan.get("insight") or f"Returned {len(rows)} rows."
+    yield "meta", {"sql": sql, "elapsed_ms": elapsed, "row_count": len(rows), "forecast": plan.get("forecast", False),
+                   "used_llm": False, "truncated": truncated, **paging, **info}
+
+def _template(plan_event: Dict[str, Any]) -> str:
+    # Bounded label values: heuristic template names, or the LLM plan's group_by if it is a known one.
+    plan = plan_event.get("plan") or {}
+    if plan.get("template"):
+        return str(plan["template"])
+    group_by = str(plan.get("group_by") or "none").lower()
+    return group_by if group_by in DIMENSION_TABLES else "other"
+
+def _with_timings(meta: Dict[str, Any]) -> Dict[str, Any]:
+    trace = current_trace()
+    if not trace:
+        return meta
+    stages: Dict[str, float] = {}
+    for name, ms in trace["stages"]:
+        stages[name] = round(stages.get(name, 0.0) + ms, 1)
+    return {**meta, "stages_ms": stages}
+
+async def _buffered(events, state: Optional[dict] = None) -> List[tuple]:
+    # Once state["detached"] is set nobody reads the answer: the stream stops at "table", by
+    # which point llm_events has written the plan cache, so no insight/forecast is computed.
+    out = []
+    try:
+        async for event, payload in events:
+            out.append((event, payload))
+            if state is not None:
+                state["table"] = state.get("table") or event == "table"
+                if state.get("detached") and state["table"]:
+                    break
+    finally:
+        await events.aclose()
+    return out
+
+def _settle(task: asyncio.Future):
+    # Cancel a losing task, or mark its exception as retrieved so asyncio does not log it.
+    if not task.done():
+        task.cancel()
+    elif not task.cancelled():
+        task.exception()
+
+_detached = set()
+
+def _detach(task: asyncio.Future, state: dict):
+    """Let a losing LLM chain run on (bounded) until its plan-cache writes are done."""
+    if task.done() or state.get("table"):
+        _settle(task)
+        return
+    state["detached"] = True
+    bounded = asyncio.ensure_future(asyncio.wait_for(task, LLM_HEDGE_DETACH_S))
+    _detached.add(bounded)
+    bounded.add_done_callback(lambda t: (_detached.discard(t), _settle(t)))
+
+def _hedgeable(question: str) -> bool:
+    # Only questions a heuristic template recognizes; "default" is a guess, not an answer.
+    return generate_sql_and_chart(question)["template"] != "default"
+
+async def hedged_events(req: ChatReq):
+    """Race the LLM chain against the heuristic path. The LLM answer is used if it is complete
+    within LLM_HEDGE_MS (or the heuristic path fails); otherwise the heuristic one, at once."""
+    start = time.perf_counter()
+    llm_state = {}
+    llm = asyncio.ensure_future(_buffered(llm_events(req), llm_state))
+    heuristic = asyncio.ensure_future(_buffered(heuristic_events(req)))
+    try:
+        await asyncio.wait({llm}, timeout=LLM_HEDGE_MS / 1000)
+        if llm.done() and llm.exception() is None:
+            winner, reason, events = "llm", "in_budget", llm.result()
+        else:
+            reason = "llm_failed" if llm.done() else "budget"
+            try:
+                winner, events = "heuristic", await heuristic
+            except Exception:
+                if reason == "llm_failed":
+                    raise
+                winner, reason, events = "llm", "heuristic_failed", await llm
+    finally:
+        _detach(llm, llm_state)
+        _settle(heuristic)
+    set_path(winner)
+    metrics.inc("hedges_total", winner=winner, reason=reason)
+    hedge = {"budget_ms": LLM_HEDGE_MS, "reason": reason, "waited_ms": int((time.perf_counter() - start) * 1000)}
+    for event, payload in events:
+        yield event, ({**payload, "path": winner, "hedge": hedge} if event == "meta" else payload)
+
+async def answer_events(req: ChatReq):
+    start = time.perf_counter()
+    await _off_loop(db_executor, ensure_db)
+    path, template = "heuristic", "unknown"
+    use_llm = os.getenv("USE_LLM", "false").lower() in ("1","true","yes")
+    answered = False
+    if use_llm and LLM_HEDGE_MS > 0 and _hedgeable(req.question):
+        async for event, payload in hedged_events(req):
+            if event == "plan":
+                template = _template(payload)
+            elif event == "meta":
+                path = payload["path"]
+            yield event, _with_timings(payload) if event == "meta" else payload
+        answered = True
+    elif use_llm:
+        try:
+            async for event, payload in llm_events(req):
+                if event == "plan":
+                    template = _template(payload)
+                yield event, _with_timings({**payload, "path": "llm"}) if event == "meta" else payload
+            path, answered = "llm", True
+        except Exception as e:
+            # Anything already emitted belongs to the abandoned LLM attempt.
+            detail = e.detail if isinstance(e, HTTPException) and isinstance(e.detail, dict) else None
+            reason = detail.get("error", "http_error") if detail else type(e).__name__
+            print("LLM path failed, falling back to heuristics:", reason, e)
+            metrics.inc("fallbacks_total", reason=reason)
+            yield "fallback", {"reason": "llm_failed", **({"error": detail} if detail else {})}
+    if not answered:
+        async for event, payload in heuristic_events(req):
+            if event == "plan":
+                template = _template(payload)
+            yield event, _with_timings({**payload, "path": "heuristic"}) if event == "meta" else payload
+    metrics.inc("chats_total", path=path, template=template)
+    metrics.observe("chat_duration_seconds", time.perf_counter() - start, path=path, template=template)
+
+async def collect(events, columnar: bool = False) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    fallback = None
+    async for event, payload in events:
+        if event == "fallback":
+            out, fallback = {}, payload
+        elif event == "table" and columnar:
+            cols, rows = payload["columns"], payload["rows"]
+            out["format"] = "columnar"
+            out["columns"] = {c: list(v) for c, v in zip(cols, zip(*rows))} if rows else {c: [] for c in cols}
+        elif event == "table":
+            out["table"] = payload
+        elif event == "chart":
+            out["chart"] = payload
+        elif event == "forecast" and columnar:
+            out["chart"]["forecast"] = payload
+        elif event == "forecast":
+            out["chart"]["data"] = out["chart"]["data"] + payload
+        elif event in ("insight", "meta"):
+            out[event] = payload
+    if fallback and "meta" in out:
+        out["meta"] = {**out["meta"], "fallback": fallback}
+    return out
+
+class SingleFlight:
+    """Identical concurrent calls share one task. The task is shielded, so a caller that
+    disconnects does not cancel the answer for the others."""
+
+    def __init__(self):
+        self._tasks: Dict[Any, asyncio.Future] = {}
+
+    async def do(self, key, factory):
+        task = self._tasks.get(key)
+        shared = task is not None
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(factory())
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key, task: asyncio.Future):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+chat_flights = SingleFlight()
+
+@app.post("/chat", response_model=ApiReply)
+async def chat(req: ChatReq):
+    trace = start_trace()
+    columnar = req.format == "columnar"
+    async with admission():
+        if SINGLE_FLIGHT:
+            key = (" ".join(req.question.split()), req.no_cache, req.format)
+            out, shared = await chat_flights.do(key, lambda: collect(answer_events(req), columnar=columnar))
+            if shared:
+                metrics.inc("coalesced_total")
+                out = {**out, "meta": {**(out.get("meta") or {}), "coalesced": True}}
+        else:
+            out = await collect(answer_events(req), columnar=columnar)
+    with stage("serialize"):
+        if columnar:
+            # Skips ApiReply validation and the stdlib encoder; the shape is built right here.
+            body = dumps(out)
+        else:
+            body = ApiReply.model_validate(out).model_dump_json()
+    return Response(body, media_type="application/json", headers={"Server-Timing": server_timing(trace)})
+
+def _ndjson(event: str, payload: Any) -> bytes:
+    return dumps({"event": event, "data": payload}) + b"\n"
+
+async def ndjson_stream(req: ChatReq):
+    # Headers are gone before the first stage runs, so stream timings travel in meta.stages_ms.
+    start_trace()
+    try:
+        async with admission():
+            async for event, payload in answer_events(req):
+                if event == "table":
+                    # Columns first, then rows in chunks so large tables never block the chart.
+                    yield _ndjson("table", {"columns": payload["columns"]})
+                    rows = payload["rows"]
+                    for i in range(0, len(rows), STREAM_CHUNK_ROWS):
+                        yield _ndjson("rows", rows[i:i + STREAM_CHUNK_ROWS])
+                else:
+                    yield _ndjson(event, payload)
+    except HTTPException as e:
+        yield _ndjson("error", {"status": e.status_code, "detail": e.detail})
+    except Exception as e:
+        yield _ndjson("error", {"status": 500, "detail": str(e)})
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatReq):
+    if _inflight >= MAX_INFLIGHT_CHATS:
+        raise HTTPException(status_code=503, detail="Server busy, retry shortly.", headers={"Retry-After": "1"})
+    return StreamingResponse(ndjson_stream(req), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# ---- Batch ----
+# /chat/batch answers many questions (a dashboard's page load) in one request. Duplicate
+# questions are answered once; the rest run concurrently through the normal pipeline, with
+# their queries and forecasts shared through a QueryBatch.
+
+class BatchReq(BaseModel):
+    questions: List[str]
+    no_cache: bool = False
+    format: Literal["rows", "columnar"] = "rows"
+
+def run_in_snapshot(calls: list) -> list:
+    # One pooled connection, one read transaction: every query of a round sees the same data.
+    out = []
+    with read_snapshot():
+        for call in calls:
+            try:
+                out.append(call())
+            except Exception as e:
+                out.append(e)
+    return out
+
+class QueryBatch:
+    """Runs queries in rounds: once every still-running question is waiting on one, each
+    distinct SQL runs once, all in a single read snapshot. A question whose SQL fails and gets
+    repaired simply joins the next round. Forecasts with identical inputs are fitted once."""
+
+    def __init__(self, questions: int):
+        self.alive = questions
+        self._pending: Dict[tuple, tuple] = {}  # key -> (call, [futures])
+        self._forecasts: Dict[tuple, asyncio.Future] = {}
+        self.stats = {"queries": 0, "distinct_queries": 0, "rounds": 0, "forecasts": 0, "distinct_forecasts": 0}
+
+    async def query(self, key: tuple, call):
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(key, (call, []))[1].append(fut)
+        self.stats["queries"] += 1
+        self._maybe_flush()
+        return await fut
+
+    async def forecast(self, xs: list, ys: list, x_field: str, y_field: str, periods: int):
+        key = (tuple(xs), tuple(ys), x_field, y_field, periods)
+        self.stats["forecasts"] += 1
+        task = self._forecasts.get(key)
+        if task is None:
+            self.stats["distinct_forecasts"] += 1
+            task = self._forecasts[key] = asyncio.ensure_future(
+                _off_loop(forecast_executor, run_forecast, xs, ys, x_field, y_field, periods=periods))
+        return await asyncio.shield(task)
+
+    def finished(self):
+        self.alive -= 1
+        self._maybe_flush()
+
+    def _maybe_flush(self):
+        waiting = sum(len(futs) for _, futs in self._pending.values())
+        if waiting and waiting >= self.alive:
+            pending, self._pending = self._pending, {}
+            self.stats["rounds"] += 1
+            self.stats["distinct_queries"] += len(pending)
+            asyncio.ensure_future(self._run(list(pending.values())))
+
+    async def _run(self, pending: list):
+        try:
+            results = await _off_loop(db_executor, run_in_snapshot, [call for call, _ in pending])
+        except Exception as e:
+            results = [e] * len(pending)
+        for (_, futs), result in zip(pending, results):
+            for fut in futs:
+                if fut.done():
+                    continue
+                if isinstance(result, BaseException):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+
+def _batch_error(e: Exception) -> Dict[str, Any]:
+    if isinstance(e, HTTPException):
+        return {"error": {"status": e.status_code, "detail": e.detail}}
+    return {"error": {"status": 500, "detail": str(e)}}
+
+async def _batch_answer(batch: QueryBatch, req: ChatReq) -> Dict[str, Any]:
+    _batch.set(batch)  # runs in its own task, so the context change stays local to it
+    start_trace()
+    try:
+        out = await collect(answer_events(req), columnar=req.format == "columnar")
+        return out if req.format == "columnar" else ApiReply.model_validate(out).model_dump(mode="json")
+    except Exception as e:
+        print("Batch question failed:", req.question, e)
+        return _batch_error(e)
+    finally:
+        batch.finished()
+
+@app.post("/chat/batch")
+async def chat_batch(req: BatchReq):
+    if not req.questions:
+        raise HTTPException(status_code=422, detail="questions must not be empty")
+    if len(req.questions) > MAX_BATCH_QUESTIONS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_BATCH_QUESTIONS} questions per batch.")
+    start = time.perf_counter()
+    distinct = list(dict.fromkeys(q.strip() for q in req.questions))
+    async with admission():
+        batch = QueryBatch(len(distinct))
+        answers = await asyncio.gather(*(
+            _batch_answer(batch, ChatReq(question=q, no_cache=req.no_cache, format=req.format)) for q in distinct))
+    by_question = dict(zip(distinct, answers))
+    meta = {"questions": len(req.questions), "distinct_questions": len(distinct), **batch.stats,
+            "elapsed_ms": int((time.perf_counter() - start) * 1000)}
+    return Response(dumps({"results": [by_question[q.strip()] for q in req.questions], "meta": meta}),
+                    media_type="application/json")
+
+# ---- Ingest ----
+
+class IngestReq(BaseModel):
+    orders: List[Dict[str, Any]]
+    batch_size: Optional[int] = None
+
+@app.post("/ingest")
+async def ingest_orders(req: IngestReq, request: Request):
+    token = request.headers.get("x-ingest-token", "")
+    if not INGEST_TOKEN or not hmac.compare_digest(token.encode(), INGEST_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Ingest is disabled or the token is wrong.")
+    if not req.orders:
+        raise HTTPException(status_code=422, detail="orders must not be empty")
+    if len(req.orders) > MAX_INGEST_ORDERS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_INGEST_ORDERS} orders per request.")
+    try:
+        return await _off_loop(ingest_executor, ingest, req.orders, req.batch_size or INGEST_BATCH_ORDERS)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except IngestError as e:
+        raise HTTPException(status_code=409, detail=e.to_dict())
@@ -0,0 +1,275 @@
+"""Benchmarks for the query templates, the forecaster and the /chat pipeline.
+
+    python bench.py --scales 1,10,100 --out bench.json
+    python bench.py --scales 1,10,100 --compare bench.json   # exit 1 on regression
+
+Databases come from datagen.py (data/northwind_sf<scale>.sqlite, generated on first use).
+/chat is load-tested in-process through httpx's ASGI transport; on the llm path the Groq
+client is replaced by a local stub with configurable latency, so no network is involved.
+"""
+import os, sys, json, time, random, asyncio, argparse, platform, tempfile
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+# Keep benchmark plan-cache rows out of the real side-table; must happen before app imports it.
+os.environ.setdefault("PLAN_CACHE_PATH", os.path.join(tempfile.gettempdir(), "northwind_bench_llm_cache.sqlite"))
+
+import numpy as np
+import httpx
+
+import db
+import datagen
+import engine
+import rollup
+from cache import result_cache
+from sqlgen import generate_sql_and_chart
+import forecast
+import llm_groq
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
+
+# One question per sqlgen template.
+TEMPLATE_QUESTIONS = {
+    "monthly": "Monthly sales trend",
+    "country": "Sales share by country",
+    "category": "Sales by category",
+    "customer": "Top 5 customers",
+    "product": "Top 5 products by revenue",
+    "employee": "Top 3 employees by sales",
+    "default": "What sells best?",
+}
+
+# ---- Helpers ----
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    if not samples_ms:
+        return {"n": 0}
+    a = np.asarray(samples_ms)
+    p50, p95, p99 = np.percentile(a, [50, 95, 99])
+    return {"n": len(a), "mean_ms": round(float(a.mean()), 3), "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3), "p99_ms": round(float(p99), 3), "max_ms": round(float(a.max()), 3)}
+
+def peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+
+def bench_db(scale: float, seed: int) -> str:
+    path = os.path.join(DATA_DIR, f"northwind_sf{scale:g}.sqlite")
+    if not os.path.exists(path):
+        datagen.generate(path, scale=scale, seed=seed)
+    return path
+
+def use_db(path: str):
+    # Point every module-level cache at a different database file.
+    if db._pool is not None:
+        db._pool.close()
+        db._pool = None
+    db.DB_PATH = path
+    result_cache.clear()
+    with forecast._cache_lock:
+        forecast._cache.clear()
+    db.ensure_indexes()
+    rollup.ensure_fresh()
+
+# ---- Templates + forecaster ----
+
+def bench_templates(scale: float, repeat: int) -> List[Dict[str, Any]]:
+    out = []
+    use_rollup = rollup.ensure_fresh()
+    for template, question in TEMPLATE_QUESTIONS.items():
+        for on_rollup in sorted({False, use_rollup}):
+            plan = generate_sql_and_chart(question, rollup=on_rollup)
+            assert plan["template"] == template, (question, plan["template"])
+            db.run_query(plan["sql"])  # warm the page cache and statement cache
+            samples = []
+            for _ in range(repeat):
+                t = time.perf_counter()
+                _, rows = db.run_query(plan["sql"])
+                samples.append((time.perf_counter() - t) * 1000)
+            out.append({"scale": scale, "template": template, "rollup": on_rollup, "rows": len(rows), **percentiles(samples)})
+            print(f"  sf={scale:g} {template:<9} rollup={str(on_rollup):<5} p50={out[-1]['p50_ms']:.2f}ms p95={out[-1]['p95_ms']:.2f}ms")
+        vec = engine.get_engine()
+        if vec is None:
+            continue
+        samples = []
+        for _ in range(repeat):
+            t = time.perf_counter()
+            _, rows = vec.answer(template, plan.get("limit"))
+            samples.append((time.perf_counter() - t) * 1000)
+        out.append({"scale": scale, "template": template, "rollup": use_rollup, "engine": "numpy", "rows": len(rows),
+                    "load_ms": vec.load_ms, **percentiles(samples)})
+        print(f"  sf={scale:g} {template:<9} engine=numpy p50={out[-1]['p50_ms']:.3f}ms (load {vec.load_ms} ms)")
+    return out
+
+def bench_forecast(repeat: int) -> List[Dict[str, Any]]:
+    out = []
+    rng = np.random.default_rng(7)
+    for n in (24, 60, 240):
+        months = [f"{1990 + i // 12}-{i % 12 + 1:02d}" for i in range(n)]
+        season = 1 + 0.3 * np.sin(np.arange(n) * 2 * np.pi / 12)
+        ys = (1000 + 5 * np.arange(n)) * season + rng.normal(0, 30, n)
+        samples = []
+        for _ in range(repeat):
+            with forecast._cache_lock:
+                forecast._cache.clear()
+            t = time.perf_counter()
+            forecast.forecast_series(months, ys.tolist(), "month", "revenue", periods=3)
+            samples.append((time.perf_counter() - t) * 1000)
+        out.append({"points": n, "backend": forecast.FORECAST_BACKEND, **percentiles(samples)})
+        print(f"  forecast n={n:<4} p50={out[-1]['p50_ms']:.2f}ms")
+    return out
+
+# ---- Groq stub + /chat load test ----
+
+class StubGroq:
+    """Stands in for AsyncGroq: answers the intent/SQL/insight prompts after a simulated delay."""
+
+    def __init__(self, latency_ms: float, jitter_ms: float, seed: int = 0):
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self._rng = random.Random(seed)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model: str, messages: List[Dict[str, str]], temperature: float = 0.2, response_format=None):
+        await asyncio.sleep(max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms)) / 1000)
+        system, user = messages[0]["content"], messages[1]["content"]
+        if response_format:
+            question = user.split("QUESTION:")[-1].replace("\\n", " ").strip()
+            template = generate_sql_and_chart(question)["template"]
+            group_by = {"monthly": "month", "customer": "none", "default": "product"}.get(template, template)
+            content = json.dumps({"intent": "timeseries" if group_by == "month" else "aggregate",
+                                  "group_by": group_by, "metric": "revenue", "question": question})
+        elif system.startswith("Generate a SINGLE SQLite SELECT"):
+            content = generate_sql_and_chart(json.loads(user).get("question", ""))["sql"]
+        elif system.startswith("You fix"):
+            content = user.split("SQL:")[-1].replace("\\n", "\n").strip()
+        else:
+            content = "Revenue is concentrated in the top items."
+        usage = SimpleNamespace(prompt_tokens=(len(system) + len(user)) // 4, completion_tokens=len(content) // 4)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+async def _load(app, questions: List[str], requests: int, concurrency: int, no_cache: bool) -> Dict[str, Any]:
+    latencies, statuses = [], {}
+    queue = iter(range(requests))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        async def worker():
+            for i in queue:
+                t = time.perf_counter()
+                r = await client.post("/chat", json={"question": questions[i % len(questions)], "no_cache": no_cache})
+                latencies.append((time.perf_counter() - t) * 1000)
+                statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - start
+    return {"requests": requests, "concurrency": concurrency, "wall_s": round(wall, 3),
+            "rps": round(requests / wall, 2) if wall else None,
+            "errors": sum(n for s, n in statuses.items() if s != 200), "statuses": statuses, **percentiles(latencies)}
+
+async def bench_load(scale: float, modes: List[str], requests: int, concurrency: int, no_cache: bool,
+                     llm_latency_ms: float, llm_jitter_ms: float) -> List[Dict[str, Any]]:
+    import app as appmod
+    questions = appmod.examples() + list(TEMPLATE_QUESTIONS.values())
+    llm_groq._async_client = StubGroq(llm_latency_ms, llm_jitter_ms)
+    out = []
+    async with appmod.app.router.lifespan_context(appmod.app):
+        for mode in modes:
+            os.environ["USE_LLM"] = "true" if mode == "llm" else "false"
+            res = await _load(appmod.app, questions, requests, concurrency, no_cache)
+            out.append({"scale": scale, "mode": mode, "cache": not no_cache,
+                        **({"llm_latency_ms": llm_latency_ms} if mode == "llm" else {}), **res})
+            print(f"  sf={scale:g} /chat {mode:<9} c={concurrency} p50={res['p50_ms']:.1f}ms p95={res['p95_ms']:.1f}ms "
+                  f"p99={res['p99_ms']:.1f}ms {res['rps']} req/s errors={res['errors']}")
+    return out
+
+# ---- Compare ----
+
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms")
+
+def _keyed(results: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    out = {}
+    for r in results.get("templates", []):
+        engine_tag = f" engine={r['engine']}" if r.get("engine") else ""
+        out[f"template sf={r['scale']:g} {r['template']} rollup={r['rollup']}{engine_tag}"] = r
+    for r in results.get("forecast", []):
+        out[f"forecast n={r['points']} {r['backend']}"] = r
+    for r in results.get("load", []):
+        out[f"chat sf={r['scale']:g} {r['mode']} c={r['concurrency']} cache={r['cache']}"] = r
+    return out
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float) -> List[str]:
+    """Print per-benchmark deltas; return the keys that regressed by more than `threshold`."""
+    regressions = []
+    old, cur = _keyed(base), _keyed(new)
+    for key in sorted(set(old) & set(cur)):
+        deltas = []
+        for metric in LOWER_IS_BETTER + ("rps",):
+            a, b = old[key].get(metric), cur[key].get(metric)
+            if not a or b is None:
+                continue
+            change = (b - a) / a
+            worse = change > threshold if metric in LOWER_IS_BETTER else change < -threshold
+            deltas.append(f"{metric} {a:g}→{b:g} ({change:+.0%}){' !' if worse else ''}")
+            if worse and key not in regressions:
+                regressions.append(key)
+        print(f"{'REGRESSED' if key in regressions else 'ok':<9} {key}: " + ", ".join(deltas))
+    return regressions
+
+# ---- CLI ----
+
+def main(argv: Optional[list] = None) -> int:
+    ap = argparse.ArgumentParser(description="Benchmark the Northwind chatbot backend.")
+    ap.add_argument("--scales", default="1,10", help="comma-separated datagen scale factors")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeat", type=int, default=20, help="runs per template / forecast size")
+    ap.add_argument("--requests", type=int, default=200, help="/chat requests per load phase")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--modes", default="heuristic,llm", help="load-test paths: heuristic,llm")
+    ap.add_argument("--llm-latency-ms", type=float, default=150.0)
+    ap.add_argument("--llm-jitter-ms", type=float, default=50.0)
+    ap.add_argument("--cache", action="store_true", help="allow result/plan cache hits during the load test")
+    ap.add_argument("--skip-templates", action="store_true")
+    ap.add_argument("--skip-load", action="store_true")
+    ap.add_argument("--out", help="write results JSON here (default: stdout)")
+    ap.add_argument("--compare", help="baseline results JSON to compare against")
+    ap.add_argument("--threshold", type=float, default=0.10, help="allowed relative slowdown before failing")
+    args = ap.parse_args(argv)
+
+    results: Dict[str, Any] = {
+        "meta": {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "platform": platform.platform(), "sqlite": db.sqlite3.sqlite_version, "args": vars(args)},
+        "templates": [], "forecast": [], "load": [], "rss_mb": {},
+    }
+    if not args.skip_templates:
+        print("forecast")
+        results["forecast"] = bench_forecast(args.repeat)
+    for scale in (float(s) for s in args.scales.split(",") if s.strip()):
+        print(f"scale {scale:g}")
+        use_db(bench_db(scale, args.seed))
+        if not args.skip_templates:
+            results["templates"] += bench_templates(scale, args.repeat)
+        if not args.skip_load:
+            results["load"] += asyncio.run(bench_load(
+                scale, [m.strip() for m in args.modes.split(",") if m.strip()], args.requests, args.concurrency,
+                not args.cache, args.llm_latency_ms, args.llm_jitter_ms))
+        results["rss_mb"][f"sf={scale:g}"] = peak_rss_mb()
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    text = json.dumps(results, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+        print("Wrote", args.out)
+    elif not args.compare:
+        print(text)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import os, re, time, threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+# Paged results: query id -> SQL, kept long enough for a client to page through a result.
+QUERY_REGISTRY_SIZE = int(os.getenv("QUERY_REGISTRY_SIZE", "1024"))
+QUERY_REGISTRY_TTL = float(os.getenv("QUERY_REGISTRY_TTL", "1800"))
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")")
+_SPACE = re.compile(r"\s+")
+
+def normalize_sql(sql: str) -> str:
+    # Collapse whitespace and drop trailing semicolons, leaving quoted literals untouched.
+    parts = _QUOTED.split(sql.strip())
+    for i in range(0, len(parts), 2):
+        parts[i] = _SPACE.sub(" ", parts[i])
+    return "".join(parts).strip().rstrip(";").strip()
+
+def cache_key(sql: str, params: tuple = ()) -> Tuple[str, tuple]:
+    return normalize_sql(sql), tuple(params)
+
+def estimate_rows_bytes(columns, rows) -> int:
+    # Rough resident size of a result: list/row overhead plus the payload of each value.
+    total = 64 + 16 * len(columns)
+    for r in rows:
+        total += 56 + 8 * len(r)
+        for v in r:
+            total += len(v) + 49 if isinstance(v, str) else 24
+    return total
+
+class ResultCache:
+    """Bounded LRU + TTL cache, invalidated wholesale when the data version changes. An entry
+    may also carry a stamp (e.g. the generations of the tables it read); a lookup with a
+    different stamp drops just that entry."""
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL,
+                 max_entry_bytes: int = RESULT_CACHE_MAX_ENTRY_BYTES):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_entry_bytes = max_entry_bytes
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version: Any = None
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0,
+                       "invalidations": 0, "stale": 0, "oversize": 0}
+
+    def _check_version(self, version: Any):
+        if version != self._version:
+            if self._data:
+                self._stats["invalidations"] += 1
+            self._data.clear()
+            self._bytes = 0
+            self._version = version
+
+    def _drop(self, key: Hashable):
+        _, _, nbytes, _ = self._data.pop(key)
+        self._bytes -= nbytes
+
+    def get(self, key: Hashable, version: Any = None, stamp: Any = None) -> Optional[Any]:
+        with self._lock:
+            self._check_version(version)
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, expires, _, entry_stamp = entry
+            if expires < time.monotonic():
+                self._drop(key)
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            if entry_stamp != stamp:
+                self._drop(key)
+                self._stats["stale"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._data.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, version: Any = None, nbytes: int = 0, stamp: Any = None) -> bool:
+        if nbytes > self.max_entry_bytes:
+            with self._lock:
+                self._stats["oversize"] += 1
+            return False
+        with self._lock:
+            self._check_version(version)
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, time.monotonic() + self.ttl, nbytes, stamp)
+            self._bytes += nbytes
+            while len(self._data) > self.max_entries:
+                self._drop(next(iter(self._data)))
+                self._stats["evictions"] += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+            out.update({"entries": len(self._data), "bytes": self._bytes,
+                        "max_entries": self.max_entries, "ttl_s": self.ttl})
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+        return out
+
+result_cache = ResultCache()
+query_registry = ResultCache(QUERY_REGISTRY_SIZE, QUERY_REGISTRY_TTL)
@@ -0,0 +1,108 @@
+import hashlib, json, threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from db import read_conn, data_version, ANALYTICS_TABLES
+
+TABLES = ANALYTICS_TABLES
+
+# Tables each plan dimension needs on top of the Orders ⋈ OrderDetails fact join.
+DIMENSION_TABLES = {
+    "month": [],
+    "none": [],
+    "country": ["Customers"],
+    "customer": ["Customers"],
+    "category": ["Products", "Categories"],
+    "product": ["Products"],
+    "employee": ["Employees"],
+}
+FACT_TABLES = ["Orders", "OrderDetails"]
+# Dimensions the SalesRollup cube can answer without touching the fact join.
+ROLLUP_GROUPS = ("month", "country", "category", "product", "employee")
+
+class SchemaCatalog:
+    """Snapshot of table columns, types, primary keys and FK edges for the analytics tables."""
+
+    def __init__(self, schema_version: int, tables: Dict[str, List[Dict[str, Any]]], fks: List[Dict[str, str]]):
+        self.schema_version = schema_version
+        self.tables = tables
+        self.fks = fks
+        self._compact: Dict[tuple, str] = {}
+        self.fingerprint = hashlib.sha1(self.compact().encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, conn) -> "SchemaCatalog":
+        version = conn.execute("PRAGMA schema_version").fetchone()[0]
+        tables, fks = {}, []
+        for t in TABLES:
+            cols = conn.execute(f'PRAGMA table_info("{t}")').fetchall()
+            if not cols:
+                continue
+            tables[t] = [{"name": c[1], "type": (c[2] or "").upper(), "pk": bool(c[5])} for c in cols]
+            for fk in conn.execute(f'PRAGMA foreign_key_list("{t}")').fetchall():
+                fks.append({"table": t, "column": fk[3], "ref_table": fk[2], "ref_column": fk[4] or fk[3]})
+        return cls(version, tables, fks)
+
+    def columns(self) -> Dict[str, List[str]]:
+        return {t: [c["name"] for c in cols] for t, cols in self.tables.items()}
+
+    def describe(self) -> Dict[str, Any]:
+        return {"schema_version": self.schema_version, "fingerprint": self.fingerprint,
+                "tables": self.tables, "foreign_keys": self.fks}
+
+    def compact(self, tables: Optional[Iterable[str]] = None) -> str:
+        # One line per table: Orders(OrderID INTEGER PK, CustomerID TEXT->Customers, ...)
+        names = tuple(t for t in (tables or self.tables) if t in self.tables)
+        if names not in self._compact:
+            refs = {(fk["table"], fk["column"]): fk["ref_table"] for fk in self.fks}
+            lines = []
+            for t in names:
+                parts = []
+                for c in self.tables[t]:
+                    s = f'{c["name"]} {c["type"]}'.strip()
+                    if c["pk"]:
+                        s += " PK"
+                    if (t, c["name"]) in refs:
+                        s += "->" + refs[(t, c["name"])]
+                    parts.append(s)
+                lines.append(f'{t}({", ".join(parts)})')
+            self._compact[names] = "\n".join(lines)
+        return self._compact[names]
+
+    def tables_for(self, plan: Optional[Dict[str, Any]]) -> List[str]:
+        # Prune to the fact tables plus the dimensions named by the plan's group_by/filters.
+        if not plan:
+            return list(self.tables)
+        group_by = str(plan.get("group_by") or "none").lower()
+        if group_by not in DIMENSION_TABLES:
+            return list(self.tables)
+        wanted = FACT_TABLES + DIMENSION_TABLES[group_by]
+        if group_by in ROLLUP_GROUPS:
+            wanted = wanted + ["SalesRollup"]
+        filters = json.dumps(plan.get("filters") or "", ensure_ascii=False).lower()
+        for key, extra in DIMENSION_TABLES.items():
+            if key in filters:
+                wanted += extra
+        seen = []
+        for t in wanted:
+            if t in self.tables and t not in seen:
+                seen.append(t)
+        return seen
+
+_catalog: Optional[SchemaCatalog] = None
+_catalog_token = None
+_catalog_lock = threading.Lock()
+
+def get_catalog() -> SchemaCatalog:
+    # Rebuild only when the schema_version moves; the stat-based data token gates even that check.
+    global _catalog, _catalog_token
+    token = data_version()
+    if _catalog is not None and token == _catalog_token:
+        return _catalog
+    with _catalog_lock:
+        if _catalog is None or token != _catalog_token:
+            with read_conn() as conn:
+                version = conn.execute("PRAGMA schema_version").fetchone()[0]
+                if _catalog is None or version != _catalog.schema_version:
+                    _catalog = SchemaCatalog.load(conn)
+            _catalog_token = token
+    return _catalog
@@ -0,0 +1,276 @@
+"""Offline synthetic Northwind generator.
+
+    python datagen.py --scale 100 --out data/northwind_sf100.sqlite
+
+Scale factor 1 is roughly the classic dataset (~830 orders, ~2k OrderDetails rows);
+each unit of scale adds about that much again, so --scale 10000 gives ~20M OrderDetails rows.
+Output is deterministic for a given --seed and scale.
+"""
+import os, time, sqlite3, argparse
+from datetime import date
+from typing import Optional
+import numpy as np
+
+from db import INDEXES
+
+ORDERS_PER_SCALE = 830
+BATCH_ROWS = int(os.getenv("DATAGEN_BATCH", "200000"))
+
+SCHEMA = """
+CREATE TABLE Categories (
+  CategoryID INTEGER PRIMARY KEY,
+  CategoryName TEXT,
+  Description TEXT
+);
+CREATE TABLE Suppliers (
+  SupplierID INTEGER PRIMARY KEY,
+  CompanyName TEXT,
+  Country TEXT
+);
+CREATE TABLE Shippers (
+  ShipperID INTEGER PRIMARY KEY,
+  CompanyName TEXT
+);
+CREATE TABLE Customers (
+  CustomerID TEXT PRIMARY KEY,
+  CompanyName TEXT,
+  ContactName TEXT,
+  Country TEXT,
+  City TEXT
+);
+CREATE TABLE Employees (
+  EmployeeID INTEGER PRIMARY KEY,
+  LastName TEXT,
+  FirstName TEXT,
+  Title TEXT,
+  Country TEXT
+);
+CREATE TABLE Products (
+  ProductID INTEGER PRIMARY KEY,
+  ProductName TEXT,
+  CategoryID INTEGER,
+  SupplierID INTEGER,
+  UnitPrice REAL,
+  Discontinued INTEGER,
+  FOREIGN KEY(CategoryID) REFERENCES Categories(CategoryID),
+  FOREIGN KEY(SupplierID) REFERENCES Suppliers(SupplierID)
+);
+CREATE TABLE Orders (
+  OrderID INTEGER PRIMARY KEY,
+  CustomerID TEXT,
+  EmployeeID INTEGER,
+  OrderDate TEXT,
+  ShipVia INTEGER,
+  Freight REAL,
+  FOREIGN KEY(CustomerID) REFERENCES Customers(CustomerID),
+  FOREIGN KEY(EmployeeID) REFERENCES Employees(EmployeeID),
+  FOREIGN KEY(ShipVia) REFERENCES Shippers(ShipperID)
+);
+CREATE TABLE OrderDetails (
+  OrderID INTEGER,
+  ProductID INTEGER,
+  UnitPrice REAL,
+  Quantity INTEGER,
+  Discount REAL,
+  FOREIGN KEY(OrderID) REFERENCES Orders(OrderID),
+  FOREIGN KEY(ProductID) REFERENCES Products(ProductID)
+);
+"""
+
+CATEGORIES = [
+    ("Beverages", "Soft drinks, coffees, teas, beers, and ales"),
+    ("Condiments", "Sweet and savory sauces, relishes, spreads, and seasonings"),
+    ("Confections", "Desserts, candies, and sweet breads"),
+    ("Dairy Products", "Cheeses"),
+    ("Grains/Cereals", "Breads, crackers, pasta, and cereal"),
+    ("Meat/Poultry", "Prepared meats"),
+    ("Produce", "Dried fruit and bean curd"),
+    ("Seafood", "Seaweed and fish"),
+]
+# Rough share of Northwind customers per country.
+COUNTRIES = {
+    "USA": 13, "Germany": 11, "France": 11, "Brazil": 9, "UK": 7, "Spain": 5, "Mexico": 5,
+    "Venezuela": 4, "Argentina": 3, "Canada": 3, "Italy": 3, "Sweden": 2, "Belgium": 2,
+    "Switzerland": 2, "Portugal": 2, "Austria": 2, "Denmark": 2, "Finland": 2, "Ireland": 1, "Norway": 1, "Poland": 1,
+}
+SHIPPERS = ["Speedy Express", "United Package", "Federal Shipping"]
+FIRST = ["Nancy", "Andrew", "Janet", "Margaret", "Steven", "Michael", "Robert", "Laura", "Anne", "Maria", "Pedro", "Hanna"]
+LAST = ["Davolio", "Fuller", "Leverling", "Peacock", "Buchanan", "Suyama", "King", "Callahan", "Dodsworth", "Anders", "Moos"]
+WORDS = ["Alpine", "Baltic", "Coastal", "Delta", "Eastern", "Golden", "Harbor", "Island", "Lakeside", "Northern",
+         "Old", "Royal", "Southern", "Valley", "Western", "Grand", "Little", "Prime", "Rustic", "Urban"]
+NOUNS = ["Delikatessen", "Markt", "Foods", "Traders", "Imports", "Grocers", "Bistro", "Pantry", "Emporium", "Provisions"]
+GOODS = ["Chai", "Chang", "Syrup", "Seasoning", "Gumbo", "Marmalade", "Cheese", "Tofu", "Biscuits", "Lager",
+         "Coffee", "Ravioli", "Sauerkraut", "Crab Meat", "Chocolate", "Gnocchi", "Pâté", "Spread", "Kaviar", "Bread"]
+# Q4-heavy retail seasonality, January = index 0.
+SEASON = np.array([0.85, 0.80, 0.95, 1.00, 0.95, 0.90, 0.85, 0.90, 1.00, 1.10, 1.25, 1.45])
+DISCOUNTS = np.array([0.0, 0.05, 0.10, 0.15, 0.20, 0.25])
+DISCOUNT_P = np.array([0.62, 0.10, 0.09, 0.08, 0.07, 0.04])
+LINES_P = np.array([0.30, 0.30, 0.20, 0.12, 0.08])  # 1..5 lines per order, ~2.5 on average
+
+def _pareto_weights(rng: np.random.Generator, n: int, alpha: float = 1.16) -> np.ndarray:
+    # alpha≈1.16 is the classic 80/20 split: a fifth of customers/products carry most revenue.
+    # Clipped at the 99th percentile so one runaway draw cannot take most of the volume.
+    w = rng.pareto(alpha, n) + 1.0
+    w = np.minimum(w, np.quantile(w, 0.99))
+    return w / w.sum()
+
+def _add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+def _month_orders(total: int, start: date, months: int, growth: float) -> np.ndarray:
+    # Seasonality × linear growth across the range, normalized to the requested total.
+    idx = np.arange(months)
+    weight = SEASON[(start.month - 1 + idx) % 12] * (1.0 + growth * idx / max(months - 1, 1))
+    counts = np.floor(total * weight / weight.sum()).astype(int)
+    counts[: total - counts.sum()] += 1
+    return counts
+
+def _insert_dimensions(conn: sqlite3.Connection, rng: np.random.Generator, scale: float):
+    n_customers = max(91, int(91 * scale ** 0.5))
+    n_products = max(77, int(77 * scale ** 0.33))
+    n_employees = max(9, int(9 * scale ** 0.25))
+    n_suppliers = max(29, int(29 * scale ** 0.33))
+
+    conn.executemany("INSERT INTO Categories VALUES (?,?,?)",
+                     [(i + 1, name, desc) for i, (name, desc) in enumerate(CATEGORIES)])
+    conn.executemany("INSERT INTO Shippers VALUES (?,?)", [(i + 1, n) for i, n in enumerate(SHIPPERS)])
+    country_names = list(COUNTRIES)
+    country_p = np.array(list(COUNTRIES.values()), dtype=float)
+    country_p /= country_p.sum()
+
+    sup_country = rng.choice(len(country_names), n_suppliers, p=country_p)
+    conn.executemany("INSERT INTO Suppliers VALUES (?,?,?)",
+                     [(i + 1, f"{WORDS[i % len(WORDS)]} {NOUNS[(i // len(WORDS)) % len(NOUNS)]} {i + 1}", country_names[c])
+                      for i, c in enumerate(sup_country.tolist())])
+
+    cust_country = rng.choice(len(country_names), n_customers, p=country_p)
+    customers = [f"C{i:06d}" for i in range(n_customers)]
+    conn.executemany("INSERT INTO Customers VALUES (?,?,?,?,?)",
+                     [(cid, f"{WORDS[i % len(WORDS)]} {NOUNS[i % len(NOUNS)]} {i}",
+                       f"{FIRST[i % len(FIRST)]} {LAST[(i * 7) % len(LAST)]}", country_names[c], f"City {c}-{i % 17}")
+                      for i, (cid, c) in enumerate(zip(customers, cust_country.tolist()))])
+
+    conn.executemany("INSERT INTO Employees VALUES (?,?,?,?,?)",
+                     [(i + 1, LAST[i % len(LAST)], FIRST[i % len(FIRST)],
+                       "Sales Manager" if i == 0 else "Sales Representative", "USA" if i % 3 else "UK")
+                      for i in range(n_employees)])
+
+    # Log-normal list prices around Northwind's ~$28 median.
+    prices = np.round(np.clip(rng.lognormal(3.1, 0.75, n_products), 2.5, 265.0), 2)
+    categories = rng.integers(1, len(CATEGORIES) + 1, n_products)
+    suppliers = rng.integers(1, n_suppliers + 1, n_products)
+    conn.executemany("INSERT INTO Products VALUES (?,?,?,?,?,?)",
+                     [(i + 1, f"{GOODS[i % len(GOODS)]} {i + 1}", c, s, p, int(i % 13 == 0))
+                      for i, (c, s, p) in enumerate(zip(categories.tolist(), suppliers.tolist(), prices.tolist()))])
+
+    return {
+        "customers": customers,
+        "customer_p": _pareto_weights(rng, n_customers),
+        "product_p": _pareto_weights(rng, n_products),
+        "prices": prices,
+        "n_employees": n_employees,
+    }
+
+def generate(path: str, scale: float = 1.0, seed: int = 42, start: str = "1996-07", months: int = 23,
+             growth: float = 0.6, batch_rows: int = BATCH_ROWS, force: bool = False) -> dict:
+    """Build a Northwind-shaped database at `path`; written to a temp file and renamed into place."""
+    if os.path.exists(path) and not force:
+        raise FileExistsError(f"{path} exists (use --force to overwrite)")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    for p in (tmp, tmp + "-journal"):
+        if os.path.exists(p):
+            os.remove(p)
+    t0 = time.time()
+    rng = np.random.default_rng(seed)
+    first = date(int(start[:4]), int(start[5:7]), 1)
+
+    conn = sqlite3.connect(tmp, isolation_level=None)
+    # Bulk-load settings: nothing here needs to survive a crash, the temp file is simply discarded.
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute("PRAGMA locking_mode=EXCLUSIVE")
+    conn.execute("PRAGMA cache_size=-262144")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.executescript(SCHEMA)
+    conn.execute("BEGIN")
+    dims = _insert_dimensions(conn, rng, scale)
+    conn.execute("COMMIT")
+
+    customers, prices = dims["customers"], dims["prices"]
+    total_orders = max(12, int(ORDERS_PER_SCALE * scale))
+    order_id, n_lines = 10248, 0
+    pending_orders, pending_lines = [], []
+
+    def flush():
+        conn.execute("BEGIN")
+        conn.executemany("INSERT INTO Orders VALUES (?,?,?,?,?,?)", pending_orders)
+        conn.executemany("INSERT INTO OrderDetails VALUES (?,?,?,?,?)", pending_lines)
+        conn.execute("COMMIT")
+        pending_orders.clear()
+        pending_lines.clear()
+
+    for m, n in enumerate(_month_orders(total_orders, first, months, growth).tolist()):
+        if n == 0:
+            continue
+        month = _add_months(first, m)
+        days = (_add_months(month, 1) - month).days
+        day = np.sort(rng.integers(1, days + 1, n))
+        ids = np.arange(order_id, order_id + n)
+        order_id += n
+        cust = rng.choice(len(customers), n, p=dims["customer_p"])
+        emp = rng.integers(1, dims["n_employees"] + 1, n)
+        ship = rng.integers(1, len(SHIPPERS) + 1, n)
+        freight = np.round(rng.gamma(1.5, 50.0, n), 2)
+        prefix = month.strftime("%Y-%m-")
+        pending_orders.extend(
+            (i, customers[c], e, f"{prefix}{d:02d}", s, f)
+            for i, c, e, d, s, f in zip(ids.tolist(), cust.tolist(), emp.tolist(), day.tolist(), ship.tolist(), freight.tolist()))
+
+        per_order = rng.choice(len(LINES_P), n, p=LINES_P) + 1
+        line_order = np.repeat(ids, per_order)
+        k = len(line_order)
+        prod = rng.choice(len(prices), k, p=dims["product_p"])
+        unit = np.round(prices[prod] * rng.uniform(0.9, 1.1, k), 2)
+        qty = np.clip(np.round(rng.lognormal(2.7, 0.8, k)), 1, 130).astype(int)
+        disc = rng.choice(DISCOUNTS, k, p=DISCOUNT_P)
+        pending_lines.extend(zip(line_order.tolist(), (prod + 1).tolist(), unit.tolist(), qty.tolist(), disc.tolist()))
+        n_lines += k
+        if len(pending_lines) >= batch_rows:
+            flush()
+            print(f"  {month:%Y-%m}: {order_id - 10248:,} orders / {n_lines:,} lines ({time.time() - t0:.1f}s)")
+    if pending_orders:
+        flush()
+
+    # Indexes after the load: one sorted build per index instead of per-row b-tree inserts.
+    for name, table, cols in INDEXES:
+        conn.execute(f'CREATE INDEX {name} ON "{table}"({cols})')
+    conn.execute("ANALYZE")
+    conn.execute("PRAGMA locking_mode=NORMAL")
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.close()
+    os.replace(tmp, path)
+    stats = {"path": path, "scale": scale, "seed": seed, "orders": order_id - 10248, "order_details": n_lines,
+             "customers": len(customers), "products": len(prices), "elapsed_s": round(time.time() - t0, 2),
+             "bytes": os.path.getsize(path)}
+    print("Generated:", stats)
+    return stats
+
+def main(argv: Optional[list] = None):
+    ap = argparse.ArgumentParser(description="Generate a synthetic Northwind SQLite database.")
+    ap.add_argument("--scale", type=float, default=1.0, help="1 ≈ classic Northwind size; 10000 ≈ 20M OrderDetails rows")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", default=None, help="default: data/northwind_sf<scale>.sqlite")
+    ap.add_argument("--start", default="1996-07", help="first order month, YYYY-MM")
+    ap.add_argument("--months", type=int, default=23)
+    ap.add_argument("--growth", type=float, default=0.6, help="order volume growth from first to last month")
+    ap.add_argument("--batch", type=int, default=BATCH_ROWS, help="OrderDetails rows per transaction")
+    ap.add_argument("--force", action="store_true", help="overwrite --out if it exists")
+    args = ap.parse_args(argv)
+    out = args.out or os.path.join(os.path.dirname(__file__), "data", f"northwind_sf{args.scale:g}.sqlite")
+    generate(out, scale=args.scale, seed=args.seed, start=args.start, months=args.months,
+             growth=args.growth, batch_rows=args.batch, force=args.force)
+
+if __name__ == "__main__":
+    main()
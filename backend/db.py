@@ -1,8 +1,34 @@
-import sqlite3, os, urllib.request
+import sqlite3, os, re, time, queue, threading
+from contextlib import contextmanager
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "data", "northwind.sqlite")
+DB_PATH = os.getenv("NORTHWIND_DB") or os.path.join(os.path.dirname(__file__), "data", "northwind.sqlite")
+# How a missing DB is seeded: download (jpwhite3, mini fallback) | snapshot (bundled
+# data/northwind.v*.sqlite.gz, synthetic datagen data, then download) | synthetic (datagen.py,
+# offline) | mini
+NORTHWIND_SEED = os.getenv("NORTHWIND_SEED", "download").lower()
+NORTHWIND_SCALE = float(os.getenv("NORTHWIND_SCALE", "1"))
 JPWHITE3_SQL = "https://raw.githubusercontent.com/jpwhite3/northwind-SQLite3/master/Northwind.Sqlite3.create.sql"
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_CACHE_KB = int(os.getenv("DB_CACHE_KB", "65536"))
+DB_MMAP_BYTES = int(os.getenv("DB_MMAP_BYTES", str(256 * 1024 * 1024)))
+DB_STMT_CACHE = int(os.getenv("DB_STMT_CACHE", "256"))
+DB_HEALTH_INTERVAL = float(os.getenv("DB_HEALTH_INTERVAL", "30"))
+DB_FETCH_BATCH = int(os.getenv("DB_FETCH_BATCH", "256"))
+# How the read pool sees the DB: file (WAL/rollback readers on DB_PATH) | immutable (private
+# read-only copy opened with immutable=1, no locking) | memory (in-memory copy per connection)
+DB_SERVE_MODE = os.getenv("DB_SERVE_MODE", "file").lower()
+DB_IMMUTABLE_MMAP_BYTES = int(os.getenv("DB_IMMUTABLE_MMAP_BYTES", str(4 * 1024 * 1024 * 1024)))
+DB_SWAP_INTERVAL = float(os.getenv("DB_SWAP_INTERVAL", "2"))  # seconds between file change checks
+QUERY_TIMEOUT_MS = int(os.getenv("QUERY_TIMEOUT_MS", "5000"))
+QUERY_MAX_STEPS = int(os.getenv("QUERY_MAX_STEPS", "500000000"))  # SQLite VM instructions
+QUERY_CHECK_EVERY = int(os.getenv("QUERY_CHECK_EVERY", "10000"))
+
+# The only tables pooled (read) connections may touch; sqlite_* meta tables stay readable
+# for the catalog and the plan guard.
+ANALYTICS_TABLES = ["Orders","OrderDetails","Products","Customers","Categories","Employees","Shippers","Suppliers","SalesRollup"]
+
 MINI_SQL = """
 PRAGMA foreign_keys=ON;
 
@@ -84,13 +110,42 @@ INSERT OR IGNORE INTO OrderDetails VALUES
 (10012,4,31.0,200,0.00);
 """
 
+_db_ready = False
+_seed_lock = threading.Lock()
+
 def ensure_db():
+    global _db_ready
+    if _db_ready:
+        return
+    with _seed_lock:
+        if not _db_ready:
+            _seed_db()
+            _db_ready = True
+
+def _seed_db():
     if os.path.exists(DB_PATH):
         return
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    if NORTHWIND_SEED == "synthetic":
+        from datagen import generate
+        print(f"Seeding synthetic Northwind (scale {NORTHWIND_SCALE:g})...")
+        generate(DB_PATH, scale=NORTHWIND_SCALE)
+        return
+    if NORTHWIND_SEED == "mini":
+        _seed_mini()
+        return
+    if NORTHWIND_SEED == "snapshot":
+        from snapshot import restore, SNAPSHOT_PATH
+        if os.path.exists(SNAPSHOT_PATH):
+            try:
+                print("Synthetic Northwind DB restored from snapshot:", restore(DB_PATH, SNAPSHOT_PATH))
+                return
+            except Exception as e:
+                print("Snapshot restore failed, trying download:", e)
     # Try: build from official script via Python executescript (no sqlite3 CLI dependency)
     try:
         print("Seeding Northwind (full) via jpwhite3 script...")
+        import urllib.request
         sql_bytes = urllib.request.urlopen(JPWHITE3_SQL, timeout=20).read()
         sql = sql_bytes.decode("utf-8")
         conn = sqlite3.connect(DB_PATH)
@@ -103,44 +158,565 @@ def ensure_db():
         print("Full seed failed, falling back to mini demo dataset:", e)
 
     # Fallback: tiny demo dataset (works offline)
+    _seed_mini()
+
+def _seed_mini():
     conn = sqlite3.connect(DB_PATH)
     conn.executescript(MINI_SQL)
     conn.commit()
     conn.close()
     print("Northwind mini demo DB created.")
 
-def get_conn():
+@contextmanager
+def write_conn():
+    # Short-lived autocommit connection for maintenance writes (rollups, indexes, ingest);
+    # callers manage their own BEGIN IMMEDIATE ... COMMIT.
     ensure_db()
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def run_query(sql: str, params: tuple = ()):
-    conn = get_conn()
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
     try:
-        cur = conn.execute(sql, params)
-        rows = cur.fetchall()
-        columns = [d[0] for d in cur.description]
-        out_rows = [[row[c] for c in columns] for row in rows]
-        return columns, out_rows
+        yield conn
     finally:
         conn.close()
+        # Copy-serving pools never see in-place writes; republish before the caller reads.
+        if DB_SERVE_MODE != "file":
+            swap_pool()
+
+# ---- Query governor ----
+# Every pooled connection carries a read-only authorizer; run_query/explain additionally
+# install a progress handler that aborts a statement past its wall-time or VM-step budget.
+
+class QueryBudgetExceeded(RuntimeError):
+    def __init__(self, kind: str, elapsed_ms: int, steps: int, limit):
+        super().__init__(f"Query exceeded its {kind} budget ({limit}) after {elapsed_ms} ms / ~{steps} VM steps.")
+        self.kind, self.elapsed_ms, self.steps, self.limit = kind, elapsed_ms, steps, limit
+
+    def to_dict(self) -> dict:
+        return {"error": "budget_exceeded", "kind": self.kind, "limit": self.limit,
+                "elapsed_ms": self.elapsed_ms, "steps": self.steps}
+
+class QueryNotAllowed(RuntimeError):
+    def to_dict(self) -> dict:
+        return {"error": "not_allowed", "reason": str(self)}
+
+_READABLE = {t.lower() for t in ANALYTICS_TABLES} | {"sqlite_master", "sqlite_schema", "sqlite_stat1"}
+_READ_PRAGMAS = {"table_info", "table_xinfo", "foreign_key_list", "index_list", "index_info", "schema_version"}
+_BLOCKED_FUNCTIONS = {"load_extension", "readfile", "writefile", "edit", "fts3_tokenizer"}
+_OK_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_RECURSIVE, sqlite3.SQLITE_TRANSACTION, sqlite3.SQLITE_SAVEPOINT}
+_denied = threading.local()
+
+def _authorize(action, arg1, arg2, db_name, source):
+    if action in _OK_ACTIONS:
+        return sqlite3.SQLITE_OK
+    # SQLite names the database only for objects in its schema (sqlite_master); reads of a
+    # CTE (e.g. the recursive reference in WITH RECURSIVE) come with db_name None.
+    if action == sqlite3.SQLITE_READ and (db_name is None or (arg1 or "").lower() in _READABLE):
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_FUNCTION and (arg2 or "").lower() not in _BLOCKED_FUNCTIONS:
+        return sqlite3.SQLITE_OK
+    if action == sqlite3.SQLITE_PRAGMA and (arg1 or "").lower() in _READ_PRAGMAS:
+        return sqlite3.SQLITE_OK
+    # Authorization happens while preparing, i.e. in the calling thread.
+    _denied.reason = {sqlite3.SQLITE_READ: f"read of {arg1}", sqlite3.SQLITE_FUNCTION: f"function {arg2}",
+                      sqlite3.SQLITE_PRAGMA: f"pragma {arg1}"}.get(action, f"action {action}")
+    return sqlite3.SQLITE_DENY
+
+@contextmanager
+def governed(conn: sqlite3.Connection, timeout_ms: int | None = None, max_steps: int | None = None):
+    timeout_ms = QUERY_TIMEOUT_MS if timeout_ms is None else timeout_ms
+    max_steps = QUERY_MAX_STEPS if max_steps is None else max_steps
+    start = time.monotonic()
+    deadline = start + timeout_ms / 1000.0
+    state = {"steps": 0, "tripped": None}
+
+    def progress():
+        # A non-zero return interrupts the running statement, same as conn.interrupt().
+        state["steps"] += QUERY_CHECK_EVERY
+        if max_steps and state["steps"] > max_steps:
+            state["tripped"] = ("steps", max_steps)
+        elif timeout_ms and time.monotonic() > deadline:
+            state["tripped"] = ("time", f"{timeout_ms} ms")
+        return 1 if state["tripped"] else 0
+
+    _denied.reason = None
+    conn.set_progress_handler(progress, QUERY_CHECK_EVERY)
+    try:
+        yield state
+    except sqlite3.DatabaseError as e:
+        if state["tripped"]:
+            kind, limit = state["tripped"]
+            raise QueryBudgetExceeded(kind, int((time.monotonic() - start) * 1000), state["steps"], limit) from None
+        if _denied.reason:
+            raise QueryNotAllowed(f"Query not allowed: {_denied.reason}.") from None
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+# ---- Read connection pool ----
+# Long-lived, read-only connections shared by the sync FastAPI worker threads.
+# Connections are checked out (LIFO, so the hottest page cache is reused first),
+# health-checked when they have been idle for a while, and returned on exit.
+#
+# In immutable/memory serve modes a pool reads a private copy of DB_PATH taken with the
+# backup API, so no reader ever takes a file lock or sees a half-applied write. When DB_PATH
+# changes (a writer commits, or a new file is renamed over it) a fresh pool is built and
+# swapped in; the old one drains: idle connections close at once, checked-out ones finish
+# their query and are closed on release.
+
+class PoolTimeout(RuntimeError):
+    pass
+
+class PoolClosed(PoolTimeout):
+    pass
+
+_generation = 0
+_generation_lock = threading.Lock()
+
+def _next_generation() -> int:
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        return _generation
+
+def _backup_from(path: str, dest: sqlite3.Connection):
+    src = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        src.backup(dest)
+    finally:
+        src.close()
+
+class ConnectionPool:
+    def __init__(self, path: str, size: int = DB_POOL_SIZE, timeout: float = DB_POOL_TIMEOUT,
+                 mode: str = "file"):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.mode = mode
+        self.generation = _next_generation()
+        # Taken before copying, so a write that lands mid-copy still triggers the next swap.
+        self.token = _file_version(path)
+        self._uri, self._mmap, self._image, self._copy = path, DB_MMAP_BYTES, None, None
+        start = time.monotonic()
+        if mode == "memory":
+            # Serialized once; every connection deserializes a private copy. A shared-cache
+            # memory DB would cost one copy only, but its table locks and shared b-tree mutex
+            # serialize the readers, so memory use is pool size x DB size instead.
+            mem = sqlite3.connect(":memory:")
+            try:
+                _backup_from(path, mem)
+                self._image = bytearray(mem.serialize())
+                # A backup of a WAL-mode DB keeps the WAL file-format bytes in its header, and
+                # a deserialized image marked WAL cannot be opened; 1/1 is rollback journal.
+                self._image[18:20] = b"\x01\x01"
+            finally:
+                mem.close()
+        elif mode == "immutable":
+            self._copy = f"{path}.serve-{os.getpid()}-{self.generation}"
+            dest = sqlite3.connect(self._copy)
+            try:
+                _backup_from(path, dest)
+                dest.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                dest.close()
+            self._uri = f"file:{self._copy}?mode=ro&immutable=1"
+            self._mmap = max(DB_MMAP_BYTES, DB_IMMUTABLE_MMAP_BYTES)
+        elif mode != "file":
+            raise ValueError(f"Unknown DB_SERVE_MODE {mode!r} (file | immutable | memory).")
+        self.load_ms = int((time.monotonic() - start) * 1000)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._last_used = {}
+        self._closed = False
+        self._stats = {"created": 0, "checkouts": 0, "waits": 0, "timeouts": 0,
+                       "health_failures": 0, "discarded": 0, "in_use": 0}
+
+    def _bump(self, key: str, n: int = 1):
+        with self._lock:
+            self._stats[key] += n
 
-def get_schema():
-    conn = get_conn()
-    cur = conn.cursor()
-    tables = ["Orders","OrderDetails","Products","Customers","Categories","Employees","Shippers","Suppliers"]
-    schema = {}
-    for t in tables:
+    def _open(self) -> sqlite3.Connection:
+        image = self._image
+        if self.mode == "memory":
+            if image is None:
+                raise PoolClosed("Connection pool is closed.")
+            conn = sqlite3.connect(":memory:", check_same_thread=False, cached_statements=DB_STMT_CACHE)
+            conn.deserialize(image)
+        else:
+            conn = sqlite3.connect(self._uri, uri=self.mode != "file", check_same_thread=False,
+                                   cached_statements=DB_STMT_CACHE)
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KB}")
+        conn.execute(f"PRAGMA mmap_size={self._mmap}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA query_only=ON")
+        # Installed once: set_authorizer expires every prepared statement, so toggling it
+        # per query would defeat the statement cache.
+        conn.set_authorizer(_authorize)
+        self._bump("created")
+        return conn
+
+    def _discard(self, conn: sqlite3.Connection):
+        self._last_used.pop(id(conn), None)
+        self._bump("discarded")
         try:
-            cur.execute(f'PRAGMA table_info("{t}")')
-            cols = [r[1] for r in cur.fetchall()]
-            if cols: schema[t] = cols
+            conn.close()
         except Exception:
             pass
-    conn.close()
-    return schema
 
-import json
-def schema_json():
-    return json.dumps(get_schema(), indent=2)
\ No newline at end of file
+    def _healthy(self, conn: sqlite3.Connection) -> bool:
+        if time.monotonic() - self._last_used.get(id(conn), 0.0) < DB_HEALTH_INTERVAL:
+            return True
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            self._bump("health_failures")
+            return False
+
+    def acquire(self) -> sqlite3.Connection:
+        if self._closed:
+            raise PoolClosed("Connection pool is closed.")
+        if not self._slots.acquire(blocking=False):
+            self._bump("waits")
+            if not self._slots.acquire(timeout=self.timeout):
+                self._bump("timeouts")
+                raise PoolTimeout(f"No database connection available within {self.timeout}s.")
+        try:
+            conn = None
+            while conn is None:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    conn = self._open()
+                    break
+                if not self._healthy(conn):
+                    self._discard(conn)
+                    conn = None
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._stats["checkouts"] += 1
+            self._stats["in_use"] += 1
+        if self._closed:
+            # Closed by a swap while this checkout was in progress.
+            self.release(conn)
+            raise PoolClosed("Connection pool is closed.")
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                self._discard(conn)
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.put(conn)
+        except sqlite3.Error:
+            self._discard(conn)
+        finally:
+            self._bump("in_use", -1)
+            self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        out.update({"size": self.size, "idle": self._idle.qsize(), "path": self.path, "mode": self.mode,
+                    "generation": self.generation, "load_ms": self.load_ms, "swaps": _swaps})
+        return out
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        self._image = None
+        if self._copy:
+            try:
+                # Open connections keep the unlinked inode readable until they are released.
+                os.remove(self._copy)
+            except OSError:
+                pass
+
+_pool = None
+_pool_lock = threading.Lock()
+_swap_lock = threading.Lock()
+_swaps = 0
+_swap_check = {"at": 0.0, "running": False}
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        ensure_db()
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH, mode=DB_SERVE_MODE)
+    elif time.monotonic() - _swap_check["at"] > DB_SWAP_INTERVAL:
+        _check_swap()
+    return _pool
+
+def _stale(pool: ConnectionPool) -> bool:
+    current = _file_version(pool.path)
+    if pool.mode == "file":
+        # In-place writes are visible to file readers; only a replaced file (new inode) is not.
+        return current[0] != pool.token[0]
+    return current != pool.token
+
+def _check_swap():
+    # Throttled, off the request path: the stale pool keeps serving until the new one is ready.
+    _swap_check["at"] = time.monotonic()
+    pool = _pool
+    if pool is None or _swap_check["running"] or not _stale(pool):
+        return
+    _swap_check["running"] = True
+
+    def run():
+        try:
+            swap_pool()
+        except Exception as e:
+            print("DB pool swap failed:", e)
+        finally:
+            _swap_check["running"] = False
+    threading.Thread(target=run, name="db-pool-swap", daemon=True).start()
+
+def swap_pool(force: bool = False) -> bool:
+    """Build a pool over the current DB_PATH and publish it if the file changed; in-flight
+    queries finish on the old pool, which is closed as its connections come back."""
+    global _pool, _swaps
+    with _swap_lock:
+        old = _pool
+        if old is None or not (force or _stale(old)):
+            return False
+        new = ConnectionPool(DB_PATH, old.size, old.timeout, mode=old.mode)
+        with _pool_lock:
+            _pool = new
+            _swaps += 1
+    old.close()
+    print(f"DB pool swapped to generation {new.generation} ({new.mode}, loaded in {new.load_ms} ms).")
+    return True
+
+_snapshot = threading.local()
+
+@contextmanager
+def read_conn():
+    # Inside read_snapshot() every read on this thread shares its connection and transaction.
+    conn = getattr(_snapshot, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+    # A checkout that raced a swap retries on the newly published pool.
+    while True:
+        pool = get_pool()
+        try:
+            conn = pool.acquire()
+            break
+        except PoolClosed:
+            if pool is _pool:
+                raise
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+@contextmanager
+def read_snapshot():
+    """One pooled connection in one read transaction for this thread: run_query, explain and
+    the catalog all see the same consistent snapshot until the block exits."""
+    if getattr(_snapshot, "conn", None) is not None:
+        yield _snapshot.conn
+        return
+    with read_conn() as conn:
+        conn.execute("BEGIN")
+        _snapshot.conn = conn
+        try:
+            yield conn
+        finally:
+            _snapshot.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+    with _monitor_lock:
+        for held in _monitors.values():
+            held[2].close()
+        _monitors.clear()
+
+def pool_stats() -> dict:
+    return get_pool().stats()
+
+def current_pool():
+    """The live pool, or None before the first read; unlike get_pool never seeds or opens."""
+    return _pool
+
+# ---- Access-path indexes ----
+# Join/group keys used by every sqlgen template; the OrderDetails indexes are covering for
+# the revenue expression so fact scans never touch the table b-tree.
+INDEXES = [
+    ("idx_orders_orderdate", "Orders", "OrderDate, OrderID, CustomerID, EmployeeID"),
+    ("idx_orders_customer", "Orders", "CustomerID, OrderID"),
+    ("idx_orders_employee", "Orders", "EmployeeID, OrderID"),
+    ("idx_orderdetails_order", "OrderDetails", "OrderID, ProductID, UnitPrice, Quantity, Discount"),
+    ("idx_orderdetails_product", "OrderDetails", "ProductID, OrderID, UnitPrice, Quantity, Discount"),
+]
+
+def ensure_indexes() -> dict:
+    with write_conn() as conn:
+        tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        before = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+        created = []
+        for name, table, cols in INDEXES:
+            if table in tables and name not in before:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS {name} ON "{table}"({cols})')
+                created.append(name)
+        analyzed = bool(created) or "sqlite_stat1" not in tables
+        if analyzed:
+            conn.execute("ANALYZE")
+        after = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='index'")}
+    missing = [name for name, table, _ in INDEXES if table in tables and name not in after]
+    return {"created": created, "missing": missing, "analyzed": analyzed}
+
+def explain(sql: str, params: tuple = ()):
+    with read_conn() as conn, governed(conn):
+        return [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()]
+
+_table_rows = {"token": None, "rows": {}}
+
+def table_rows() -> dict:
+    # Row estimates from sqlite_stat1 (written by ANALYZE); empty if the DB was never analyzed.
+    token = data_version()
+    if _table_rows["token"] != token:
+        rows = {}
+        with read_conn() as conn:
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone():
+                for tbl, n in conn.execute("SELECT tbl, MAX(CAST(stat AS INTEGER)) FROM sqlite_stat1 GROUP BY tbl"):
+                    rows[tbl] = n or 0
+        _table_rows.update(token=token, rows=rows)
+    return _table_rows["rows"]
+
+_monitors = {}  # path -> (inode, serial, connection used only for PRAGMA data_version)
+_monitor_lock = threading.Lock()
+_monitor_serial = 0
+
+def _file_version(path: str = None):
+    """Change token for a DB file: (inode, monitor serial, PRAGMA data_version); all None
+    while the file is missing. data_version on a dedicated connection moves whenever another
+    connection (or process) commits, and ignores checkpoints and the -wal file coming and
+    going, which a stat of the file and its WAL would report as changes."""
+    global _monitor_serial
+    path = path or DB_PATH
+    try:
+        ino = os.stat(path).st_ino
+    except OSError:
+        return None, None, None
+    with _monitor_lock:
+        held = _monitors.get(path)
+        if held is None or held[0] != ino:
+            # New or replaced file: its counter restarts, hence the serial.
+            if held is not None:
+                held[2].close()
+            _monitor_serial += 1
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+            held = _monitors[path] = (ino, _monitor_serial, conn)
+        try:
+            return held[0], held[1], held[2].execute("PRAGMA data_version").fetchone()[0]
+        except sqlite3.Error:
+            held[2].close()
+            del _monitors[path]
+            return ino, None, None
+
+def data_version():
+    # Cheap change token for the database (see _file_version); PRAGMA data_version is
+    # per-connection, so it is read on one dedicated connection, never on pooled ones.
+    # Copy-serving pools report the version they were loaded from, so caches keyed on it
+    # only turn over once readers can actually see the new data.
+    pool = _pool
+    if DB_SERVE_MODE != "file" and pool is not None:
+        return pool.token
+    return _file_version()
+
+# ---- Change tracking ----
+# Cached results are stamped with a global change epoch plus a generation per table they read.
+# Writes made inside tracked_write() bump only the tables they declare, so e.g. an Orders ingest
+# keeps cached results over other tables. Any other change to the file (another process, a
+# replaced DB, an untracked write) shows up in data_version() and bumps the epoch instead,
+# which invalidates everything. A foreign write that lands during a tracked write in this
+# process is attributed to it.
+
+_changes = {"token": None, "epoch": 0, "writing": 0, "tables": {}}
+_changes_lock = threading.Lock()
+_tracked_lock = threading.Lock()
+_IDENT = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_TRACKED = {t.lower(): t for t in ANALYTICS_TABLES}
+
+def change_epoch() -> int:
+    token = data_version()
+    with _changes_lock:
+        if token != _changes["token"] and not _changes["writing"]:
+            if _changes["token"] is not None:
+                _changes["epoch"] += 1
+            _changes["token"] = token
+        return _changes["epoch"]
+
+def table_stamp(sql: str) -> tuple:
+    """(epoch, ((table, generation), ...)) for the analytics tables `sql` mentions."""
+    epoch = change_epoch()
+    tables = sorted({_TRACKED[w.lower()] for w in _IDENT.findall(sql) if w.lower() in _TRACKED})
+    with _changes_lock:
+        return epoch, tuple((t, _changes["tables"].get(t, 0)) for t in tables)
+
+def _bump_tables(tables):
+    with _changes_lock:
+        for t in tables:
+            _changes["tables"][t] = _changes["tables"].get(t, 0) + 1
+
+@contextmanager
+def tracked_write(tables):
+    # Generations move at the start and again at the end, so results computed while the
+    # write was in progress are dropped as well.
+    with _tracked_lock:
+        change_epoch()
+        _bump_tables(tables)
+        with _changes_lock:
+            _changes["writing"] += 1
+        try:
+            yield
+        finally:
+            _bump_tables(tables)
+            token = data_version()
+            with _changes_lock:
+                _changes["writing"] -= 1
+                _changes["token"] = token
+
+def run_query(sql: str, params: tuple = (), limit: int | None = None,
+              timeout_ms: int | None = None, max_steps: int | None = None):
+    """Columns and at most `limit` rows; the statement is abandoned once the limit is reached,
+    so SQLite never computes rows nobody reads. Raises QueryBudgetExceeded / QueryNotAllowed."""
+    with read_conn() as conn, governed(conn, timeout_ms, max_steps):
+        cur = conn.execute(sql, params)
+        try:
+            columns = [d[0] for d in cur.description]
+            out_rows = []
+            while limit is None or len(out_rows) < limit:
+                want = DB_FETCH_BATCH if limit is None else min(DB_FETCH_BATCH, limit - len(out_rows))
+                batch = cur.fetchmany(want)
+                out_rows.extend(list(row) for row in batch)
+                if len(batch) < want:
+                    break
+            return columns, out_rows
+        finally:
+            cur.close()
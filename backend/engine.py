@@ -0,0 +1,250 @@
+"""Vectorized answers for the heuristic (sqlgen) templates.
+
+Orders ⋈ OrderDetails is loaded once per data version into a few NumPy columns: line revenue,
+line → order and order → month/customer/employee positions, with every text key (country,
+company, product, category, employee name) dictionary-encoded. A template is then one
+bincount over those codes plus a top-N partition, with no SQL at query time.
+
+Results match run_query on the template SQL: same columns, ROUND(..., 2), NULL groups and
+ORDER BY tie order. Joins are done by SQLite at load time, so their semantics are identical.
+Sums are exact (as SQLite >= 3.43's compensated SUM); older SQLite sums naively in scan
+order, so a group sitting exactly on a half cent can round 0.01 apart, as it already does
+between the base-table and SalesRollup forms of the same template.
+"""
+import threading, time
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from db import read_conn, data_version
+
+LOAD_BATCH = 65536
+# Line revenue is split into a part on a 2^-16 grid, which float64 sums exactly, and a tiny
+# remainder; the group sums are then effectively exact whatever the summation order.
+_GRID = 2.0 ** 16
+
+# template -> (label column, level the group key lives at, key attribute)
+TEMPLATES = {
+    "monthly": ("month", "order", "month"),
+    "country": ("country", "order", "country"),
+    "customer": ("customer", "order", "customer"),
+    "employee": ("employee", "order", "employee"),
+    "product": ("product", "line", "product"),
+    "default": ("item", "line", "product"),
+    "category": ("category", "line", "category"),
+}
+
+ORDERS_SQL = """
+SELECT o.rowid,
+       CAST(STRFTIME('%Y', o.OrderDate) AS INTEGER) * 12 + CAST(STRFTIME('%m', o.OrderDate) AS INTEGER) - 1,
+       c.rowid, e.rowid
+FROM Orders o
+LEFT JOIN Customers c ON c.CustomerID=o.CustomerID
+LEFT JOIN Employees e ON e.EmployeeID=o.EmployeeID
+ORDER BY o.rowid
+"""
+LINES_SQL = """
+SELECT o.rowid, p.rowid, od.UnitPrice*od.Quantity*(1-od.Discount)
+FROM Orders o
+JOIN OrderDetails od ON od.OrderID=o.OrderID
+LEFT JOIN Products p ON p.ProductID=od.ProductID
+"""
+CUSTOMERS_SQL = "SELECT rowid, Country, CompanyName FROM Customers ORDER BY rowid"
+EMPLOYEES_SQL = "SELECT rowid, FirstName || ' ' || LastName FROM Employees ORDER BY rowid"
+PRODUCTS_SQL = """
+SELECT p.rowid, p.ProductName, c.CategoryName, c.rowid IS NOT NULL
+FROM Products p
+LEFT JOIN Categories c ON c.CategoryID=p.CategoryID
+ORDER BY p.rowid
+"""
+
+def _sql_order(v):
+    # SQLite's BINARY ordering across storage classes: NULL < numbers < text < blob.
+    if v is None:
+        return (0, 0)
+    if isinstance(v, (int, float)):
+        return (1, v)
+    return (2, v) if isinstance(v, str) else (3, v)
+
+def _encode(values: List[Any]) -> Tuple[np.ndarray, List[Any]]:
+    """Dictionary-encode values; codes follow the labels' SQL sort order, so group order
+    (and ORDER BY ties) need no string comparisons at query time."""
+    index: Dict[Any, int] = {}
+    codes = np.fromiter((index.setdefault(v, len(index)) for v in values), np.int32, count=len(values))
+    labels = sorted(index, key=_sql_order)
+    rank = np.empty(len(labels), np.int32)
+    rank[[index[v] for v in labels]] = np.arange(len(labels), dtype=np.int32)
+    return (rank[codes] if len(codes) else codes), labels
+
+def _numeric(conn, sql: str, width: int) -> np.ndarray:
+    # NULLs become NaN; text in a numeric position raises and the engine stays disabled.
+    cur = conn.execute(sql)
+    chunks = []
+    while True:
+        batch = cur.fetchmany(LOAD_BATCH)
+        if not batch:
+            break
+        chunks.append(np.array(batch, dtype=np.float64).reshape(-1, width))
+    return np.concatenate(chunks) if chunks else np.empty((0, width))
+
+def _lookup(keys: np.ndarray, rowids: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    # rowid (NaN = no join match) -> dimension code, -1 when unmatched.
+    out = np.full(len(keys), -1, np.int32)
+    if not len(rowids):
+        return out
+    ok = ~np.isnan(keys)
+    pos = np.searchsorted(rowids, keys[ok])
+    pos[pos >= len(rowids)] = 0
+    hit = rowids[pos] == keys[ok]
+    idx = np.flatnonzero(ok)[hit]
+    out[idx] = codes[pos[hit]]
+    return out
+
+def round2(x: Optional[float]) -> Optional[float]:
+    # SQLite's ROUND(x, 2): half away from zero on the shortest decimal repr, not Python's
+    # round-half-even on the binary value.
+    if x is None:
+        return None
+    return float(Decimal(repr(x)).quantize(Decimal("0.01"), ROUND_HALF_UP))
+
+class Engine:
+    def __init__(self, token, order: Dict[str, np.ndarray], line: Dict[str, np.ndarray],
+                 labels: Dict[str, List[Any]], load_ms: int):
+        self.token = token
+        self.order, self.line, self.labels = order, line, labels
+        self.load_ms = load_ms
+        self.queries = 0
+        self._groups: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
+
+    @classmethod
+    def load(cls, conn, token) -> "Engine":
+        start = time.time()
+        orders = _numeric(conn, ORDERS_SQL, 4)
+        lines = _numeric(conn, LINES_SQL, 3)
+        labels: Dict[str, List[Any]] = {}
+        order: Dict[str, np.ndarray] = {}
+        line: Dict[str, np.ndarray] = {}
+
+        months = orders[:, 1]
+        ok = ~np.isnan(months)
+        month_keys = np.unique(months[ok]).astype(np.int64)
+        order["month"] = np.zeros(len(orders), np.int32)  # code 0 is the NULL month
+        order["month"][ok] = np.searchsorted(month_keys, months[ok]) + 1
+        labels["month"] = [None] + [f"{k // 12:04d}-{k % 12 + 1:02d}" for k in month_keys]
+
+        cust = conn.execute(CUSTOMERS_SQL).fetchall()
+        cust_rowids = np.array([r[0] for r in cust], np.float64)
+        for i, name in ((1, "country"), (2, "customer")):
+            codes, labels[name] = _encode([r[i] for r in cust])
+            order[name] = _lookup(orders[:, 2], cust_rowids, codes)
+        emp = conn.execute(EMPLOYEES_SQL).fetchall()
+        codes, labels["employee"] = _encode([r[1] for r in emp])
+        order["employee"] = _lookup(orders[:, 3], np.array([r[0] for r in emp], np.float64), codes)
+
+        try:
+            prod = conn.execute(PRODUCTS_SQL).fetchall()
+        except Exception:
+            # No Categories table (mini dataset): category questions go to SQL.
+            prod = None
+        if prod is None:
+            prod = conn.execute("SELECT rowid, ProductName FROM Products ORDER BY rowid").fetchall()
+        prod_rowids = np.array([r[0] for r in prod], np.float64)
+        codes, labels["product"] = _encode([r[1] for r in prod])
+        line["product"] = _lookup(lines[:, 1], prod_rowids, codes)
+        if prod and len(prod[0]) == 4:
+            codes, labels["category"] = _encode([r[2] for r in prod])
+            codes[np.array([not r[3] for r in prod], bool)] = -1  # inner join to Categories
+            line["category"] = _lookup(lines[:, 1], prod_rowids, codes)
+
+        line_order = np.searchsorted(orders[:, 0], lines[:, 0]).astype(np.int32)
+        revenue = lines[:, 2]
+        valid = ~np.isnan(revenue)
+        hi = np.where(valid, np.round(revenue * _GRID) / _GRID, 0.0)
+        lo = np.where(valid, revenue - hi, 0.0)
+        line.update(hi=hi, lo=lo, valid=valid.astype(np.float64))
+        # Order-level partial sums: order-keyed templates aggregate ~2x fewer rows.
+        n_orders = len(orders)
+        order["hi"] = np.bincount(line_order, hi, n_orders)
+        order["lo"] = np.bincount(line_order, lo, n_orders)
+        order["lines"] = np.bincount(line_order, minlength=n_orders).astype(np.float64)
+        order["valid"] = np.bincount(line_order, line["valid"], n_orders)
+        line["lines"] = np.ones(len(lines))
+        return cls(token, order, line, labels, int((time.time() - start) * 1000))
+
+    def answer(self, template: str, limit: Optional[int] = None) -> Optional[Tuple[List[str], List[List[Any]]]]:
+        """Columns and rows for a sqlgen template, or None if it is not one the engine knows."""
+        if template not in TEMPLATES or TEMPLATES[template][2] not in self.labels:
+            return None
+        column, level, key = TEMPLATES[template]
+        labels = self.labels[key]
+        lines, valid, total = self.groups(level, key)
+        groups = np.flatnonzero(lines > 0)
+        self.queries += 1
+        if template == "monthly":
+            return [column, "revenue"], [[labels[g], round2(float(total[g])) if valid[g] else None] for g in groups]
+
+        # ORDER BY revenue DESC on the rounded value, NULL sums last, ties in group-key order.
+        score = np.where(valid[groups] > 0, total[groups], -np.inf)
+        if limit is not None and len(groups) > limit > 0:
+            # Rounding moves a sum by at most 0.005, so anything within 0.01 of the limit-th
+            # largest raw sum may still tie or overtake it once rounded.
+            kth = np.partition(score, len(score) - limit)[len(score) - limit]
+            groups = groups[score >= kth - 0.01]
+        elif limit is not None and limit <= 0:
+            groups = groups[:0]
+        rows = [(round2(float(total[g])) if valid[g] else None, int(g)) for g in groups]
+        rows.sort(key=lambda r: (r[0] is None, -(r[0] or 0.0), r[1]))
+        if limit is not None:
+            rows = rows[:max(limit, 0)]
+        return [column, "revenue"], [[labels[g], rev] for rev, g in rows]
+
+    def groups(self, level: str, key: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Per-group joined line count, non-NULL line count and revenue sum; fixed for the
+        # lifetime of this (per data version) engine, so computed once per key.
+        agg = self._groups.get(key)
+        if agg is None:
+            src = self.order if level == "order" else self.line
+            codes = src[key]
+            joined = codes >= 0
+            pick = (lambda a: a[joined]) if not joined.all() else (lambda a: a)
+            codes, n = pick(codes), len(self.labels[key])
+            agg = self._groups[key] = (
+                np.bincount(codes, pick(src["lines"]), n),
+                np.bincount(codes, pick(src["valid"]), n),
+                np.bincount(codes, pick(src["hi"]), n) + np.bincount(codes, pick(src["lo"]), n))
+        return agg
+
+    def stats(self) -> dict:
+        return {"orders": len(self.order["hi"]), "lines": len(self.line["hi"]), "load_ms": self.load_ms,
+                "queries": self.queries}
+
+_engine: Optional[Engine] = None
+_failed_token = None
+_load_lock = threading.Lock()
+
+def get_engine() -> Optional[Engine]:
+    """The engine for the current data version, or None while another thread (re)loads it or
+    if this database cannot be loaded; callers then run the template SQL instead."""
+    global _engine, _failed_token
+    token = data_version()
+    current = _engine
+    if current is not None and current.token == token:
+        return current
+    if token == _failed_token or not _load_lock.acquire(blocking=False):
+        return None
+    try:
+        if _engine is None or _engine.token != token:
+            with read_conn() as conn:
+                _engine = Engine.load(conn, token)
+            print(f"Vector engine loaded: {_engine.stats()}")
+        return _engine
+    except Exception as e:
+        print("Vector engine unavailable, templates run as SQL:", e)
+        _failed_token = token
+        return None
+    finally:
+        _load_lock.release()
+
+def stats() -> dict:
+    return _engine.stats() if _engine is not None else {"loaded": False}
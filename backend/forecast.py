@@ -1,35 +1,309 @@
-from typing import List, Dict, Any
-import pandas as pd
+import os, re, hashlib, threading
+import multiprocessing as mp
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
 
-def maybe_forecast(data: List[Dict[str, Any]], x_field: str, y_field: str, periods: int = 3):
-    df = pd.DataFrame(data)
-    if x_field not in df or y_field not in df:
-        return data
+FORECAST_BACKEND = os.getenv("FORECAST_BACKEND", "builtin").lower()  # builtin | prophet
+FORECAST_CACHE_SIZE = int(os.getenv("FORECAST_CACHE_SIZE", "256"))
+SEASON_LENGTH = int(os.getenv("FORECAST_SEASON", "12"))
+PROPHET_WORKERS = int(os.getenv("PROPHET_WORKERS", "2"))
+PROPHET_TIMEOUT = float(os.getenv("PROPHET_TIMEOUT", "8"))
+Z_95 = 1.96
+
+# ---- Series preparation ----
+
+_MONTH = re.compile(r"^\d{4}-\d{2}$")
+
+def _to_date(v: Any) -> date:
+    s = str(v)
+    if _MONTH.match(s):
+        return date(int(s[:4]), int(s[5:7]), 1)
+    return datetime.fromisoformat(s[:10]).date()
+
+def _add_months(d: date, n: int) -> date:
+    m = d.month - 1 + n
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+def _series(xs: List[Any], ys: List[Any]) -> Optional[Tuple[List[date], np.ndarray, str]]:
     try:
-        df["ds"] = pd.to_datetime(df[x_field])
+        pts = sorted((_to_date(x), float(y or 0)) for x, y in zip(xs, ys))
+    except (TypeError, ValueError):
+        return None
+    ds = [p[0] for p in pts]
+    y = np.array([p[1] for p in pts], dtype=float)
+    gaps = [(b - a).days for a, b in zip(ds, ds[1:])]
+    if gaps and all(28 <= g <= 31 for g in gaps):
+        freq = "MS"
+    else:
+        freq = f"{int(np.median(gaps)) if gaps else 1}D"
+    return ds, y, freq
+
+def _future_dates(last: date, periods: int, freq: str) -> List[date]:
+    if freq == "MS":
+        return [_add_months(last, i) for i in range(1, periods + 1)]
+    step = int(freq[:-1]) or 1
+    return [last + timedelta(days=step * i) for i in range(1, periods + 1)]
+
+# ---- Built-in models ----
+# Holt(-Winters) additive smoothing, fitted by evaluating a whole parameter grid at once:
+# each time step updates a (K,) vector of states, so the fit is one pass over the series.
+
+_ALPHA, _BETA, _GAMMA, _PHI = np.meshgrid(
+    [0.1, 0.2, 0.3, 0.5, 0.7, 0.9],
+    [0.01, 0.05, 0.1, 0.2, 0.3],
+    [0.05, 0.1, 0.2, 0.4],
+    [0.9, 0.98, 1.0],
+    indexing="ij",
+)
+_ALPHA, _BETA, _GAMMA, _PHI = (a.ravel() for a in (_ALPHA, _BETA, _GAMMA, _PHI))
+
+def _holt_winters(y: np.ndarray, periods: int, m: int) -> Tuple[float, np.ndarray, str]:
+    n = len(y)
+    seasonal = m > 1 and n >= 2 * m
+    k = len(_ALPHA)
+    if seasonal:
+        level0 = y[:m].mean()
+        trend0 = (y[m:2 * m].mean() - level0) / m
+        season = np.tile(y[:m] - level0, (k, 1))
+        start = m
+    else:
+        level0, trend0, season, start = y[0], y[1] - y[0], None, 1
+    level = np.full(k, level0)
+    trend = np.full(k, trend0)
+    sse = np.zeros(k)
+    for t in range(n):
+        s = season[:, t % m] if seasonal else 0.0
+        damped = _PHI * trend
+        err = y[t] - (level + damped + s)
+        if t >= start:
+            sse += err * err
+        new_level = _ALPHA * (y[t] - s) + (1 - _ALPHA) * (level + damped)
+        trend = _BETA * (new_level - level) + (1 - _BETA) * damped
+        if seasonal:
+            season[:, t % m] = _GAMMA * (y[t] - new_level) + (1 - _GAMMA) * s
+        level = new_level
+    best = int(np.argmin(sse))
+    h = np.arange(1, periods + 1)
+    phi = _PHI[best]
+    trend_sum = np.cumsum(phi ** h) * trend[best]
+    fc = level[best] + trend_sum
+    if seasonal:
+        fc = fc + season[best, (n + h - 1) % m]
+    mse = sse[best] / max(n - start, 1)
+    return mse, fc, "holt_winters" if seasonal else "holt"
+
+def _seasonal_naive(y: np.ndarray, periods: int, m: int) -> Optional[Tuple[float, np.ndarray, str]]:
+    n = len(y)
+    if m <= 1 or n < m + 2:
+        return None
+    err = y[m:] - y[:-m]
+    fc = y[n - m + (np.arange(periods) % m)]
+    return float(np.mean(err * err)), fc, "seasonal_naive"
+
+def builtin_forecast(y: np.ndarray, periods: int, m: int = SEASON_LENGTH):
+    """Best of Holt(-Winters) and seasonal-naive by in-sample one-step MSE, with ~95% bands."""
+    candidates = [_holt_winters(y, periods, m)]
+    naive = _seasonal_naive(y, periods, m)
+    if naive:
+        candidates.append(naive)
+    mse, fc, model = min(candidates, key=lambda c: c[0])
+    # Random-walk style widening; exact ETS variances are not worth the cost here.
+    band = Z_95 * np.sqrt(mse) * np.sqrt(np.arange(1, periods + 1))
+    return fc, fc - band, fc + band, model
+
+# ---- Prophet (opt-in) ----
+
+def prophet_forecast(ds: List[date], y: np.ndarray, periods: int, freq: str):
+    import pandas as pd
+    try:
+        from prophet import Prophet
     except Exception:
-        return data
-    df = df.sort_values("ds").rename(columns={y_field: "y"})
-    if len(df) < 6:
-        return data
+        from fbprophet import Prophet
+    df = pd.DataFrame({"ds": pd.to_datetime(ds), "y": y})
+    m = Prophet()
+    m.fit(df)
+    future = m.make_future_dataframe(periods=periods, freq=freq)
+    fcst = m.predict(future).tail(periods)
+    return (fcst["yhat"].to_numpy(), fcst["yhat_lower"].to_numpy(), fcst["yhat_upper"].to_numpy(), "prophet")
+
+def _warm_worker():
+    # Runs once per worker process so the first real fit does not pay the import cost.
+    import pandas  # noqa: F401
     try:
-        try:
-            from prophet import Prophet
-        except Exception:
-            from fbprophet import Prophet
-        freq = pd.infer_freq(df["ds"]) or "MS"
-        m = Prophet()
-        m.fit(df[["ds","y"]])
-        future = m.make_future_dataframe(periods=periods, freq=freq)
-        fcst = m.predict(future).tail(periods)
-        for _, row in fcst.iterrows():
-            data.append({x_field: row["ds"].strftime("%Y-%m"), y_field: float(row["yhat"]), "forecast": True})
-        return data
+        import prophet  # noqa: F401
     except Exception:
-        recent = df["y"].tail(6).mean()
-        last_ts = df["ds"].max()
-        freq = pd.infer_freq(df["ds"]) or "MS"
-        future_idx = pd.date_range(last_ts, periods=periods+1, freq=freq)[1:]
-        for ts in future_idx:
-            data.append({x_field: ts.strftime("%Y-%m"), y_field: float(recent), "forecast": True})
-        return data
\ No newline at end of file
+        pass
+
+class ProphetService:
+    """Runs Prophet fits in a warm process pool.
+
+    Identical in-flight fits share one future, every caller waits at most its own deadline,
+    and a fit that finishes after its callers gave up still lands in the forecast cache.
+    """
+
+    def __init__(self, workers: int = PROPHET_WORKERS, timeout: float = PROPHET_TIMEOUT):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"submitted": 0, "deduped": 0, "completed": 0, "timeouts": 0, "failures": 0}
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn, not fork: the parent is a threaded server process.
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=mp.get_context("spawn"),
+                                                 initializer=_warm_worker)
+        return self._executor
+
+    def warm(self):
+        try:
+            with self._lock:
+                pool = self._pool()
+            for f in [pool.submit(int, 0) for _ in range(self.workers)]:
+                f.result()
+        except Exception as e:
+            print("Prophet worker warm-up failed:", e)
+            with self._lock:
+                self._executor = None
+
+    def _finished(self, key: str, on_result, fut: Future):
+        with self._lock:
+            self._inflight.pop(key, None)
+            # exception() raises CancelledError on a cancelled future (e.g. at shutdown).
+            error = None if fut.cancelled() else fut.exception()
+            failed = fut.cancelled() or error is not None
+            self._stats["failures" if failed else "completed"] += 1
+            if isinstance(error, BrokenProcessPool):
+                self._executor = None
+        if not failed:
+            on_result(fut.result())
+
+    def fit(self, key: str, ds: List[date], y: np.ndarray, periods: int, freq: str, on_result, timeout: Optional[float] = None):
+        """Prophet result, or None if the deadline passed first; raises if the fit itself failed."""
+        with self._lock:
+            fut = self._inflight.get(key)
+            submitted = fut is None
+            if submitted:
+                try:
+                    fut = self._pool().submit(prophet_forecast, ds, y, periods, freq)
+                except BrokenProcessPool:
+                    self._executor = None
+                    raise
+                self._inflight[key] = fut
+                self._stats["submitted"] += 1
+            else:
+                self._stats["deduped"] += 1
+        if submitted:
+            # Outside the lock: the callback runs inline if the future is already done.
+            fut.add_done_callback(lambda f: self._finished(key, on_result, f))
+        try:
+            return fut.result(timeout=self.timeout if timeout is None else timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._stats["timeouts"] += 1
+            return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "inflight": len(self._inflight), "workers": self.workers,
+                    "started": self._executor is not None}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+prophet_service = ProphetService()
+
+# ---- Cache + entry point ----
+
+# Model output (yhat, lower, upper, model) per input series; field names are attached per call.
+_cache: "OrderedDict[str, tuple]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0, "invalidated": 0}
+_spans: Dict[str, tuple] = {}  # key -> (first, last) date of the fitted series
+
+def _series_key(ds: List[date], y: np.ndarray, periods: int, freq: str, backend: str) -> str:
+    h = hashlib.sha1(y.tobytes())
+    h.update(f"{ds[0]}|{ds[-1]}|{len(ds)}|{periods}|{freq}|{backend}".encode())
+    return h.hexdigest()
+
+def _store(key: str, fc: tuple, span: tuple):
+    with _cache_lock:
+        _cache[key] = fc
+        _spans[key] = span
+        while len(_cache) > FORECAST_CACHE_SIZE:
+            _spans.pop(_cache.popitem(last=False)[0], None)
+
+def invalidate_months(months) -> int:
+    """Drop forecasts fitted on a series that covers any of `months` ('YYYY-MM'); returns
+    how many were dropped."""
+    touched = set()
+    for m in months:
+        try:
+            touched.add(date(int(m[:4]), int(m[5:7]), 1))
+        except (TypeError, ValueError):
+            continue
+    with _cache_lock:
+        stale = [k for k, (first, last) in _spans.items()
+                 if any(first.replace(day=1) <= d <= last for d in touched)]
+        for k in stale:
+            _cache.pop(k, None)
+            _spans.pop(k, None)
+        _cache_stats["invalidated"] += len(stale)
+    return len(stale)
+
+def _points(fc, ds: List[date], periods: int, freq: str, x_field: str, y_field: str) -> List[Dict[str, Any]]:
+    yhat, lower, upper, model = fc
+    fmt = "%Y-%m" if freq == "MS" else "%Y-%m-%d"
+    return [
+        {x_field: d.strftime(fmt), y_field: float(v), "forecast": True,
+         "lower": float(lo), "upper": float(hi), "model": model}
+        for d, v, lo, hi in zip(_future_dates(ds[-1], periods, freq), yhat, lower, upper)
+    ]
+
+def cache_stats() -> dict:
+    with _cache_lock:
+        out = {**_cache_stats, "entries": len(_cache)}
+    if FORECAST_BACKEND == "prophet":
+        out["prophet"] = prophet_service.stats()
+    return out
+
+def forecast_series(xs: List[Any], ys: List[Any], x_field: str, y_field: str, periods: int = 3,
+                    timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Forecast points for parallel x/y columns; empty if the series is not a usable time series."""
+    series = _series(xs, ys)
+    if series is None:
+        return []
+    ds, y, freq = series
+    if len(y) < 6:
+        return []
+    key = _series_key(ds, y, periods, freq, FORECAST_BACKEND)
+    with _cache_lock:
+        fc = _cache.get(key)
+        if fc is not None:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+        else:
+            _cache_stats["misses"] += 1
+    if fc is None:
+        cacheable = True
+        if FORECAST_BACKEND == "prophet":
+            try:
+                fc = prophet_service.fit(key, ds, y, periods, freq, timeout=timeout,
+                                         on_result=lambda res: _store(key, res, (ds[0], ds[-1])))
+                # Missed deadline: answer with the cheap model now, but leave the key free for
+                # the Prophet result that is still being fitted.
+                cacheable = fc is not None
+            except Exception:
+                fc = None
+        if fc is None:
+            fc = builtin_forecast(y, periods)
+        if cacheable:
+            _store(key, fc, (ds[0], ds[-1]))
+    return _points(fc, ds, periods, freq, x_field, y_field)
@@ -0,0 +1,148 @@
+"""Append Orders/OrderDetails to the live database.
+
+    python ingest.py orders.ndjson [--batch 500]     # or a JSON list; "-" reads stdin
+
+Each order is a JSON object of Orders columns plus "lines", a list of OrderDetails rows
+(OrderID is filled in). Orders are written in batches, one BEGIN IMMEDIATE transaction each,
+with the database in WAL mode so readers keep their snapshot while a batch commits. Every
+batch rebuilds the SalesRollup months it touched in the same transaction.
+
+Readers see the change through db.tracked_write: cached results over Orders, OrderDetails and
+SalesRollup go stale (others stay cached), forecasts over the affected months are dropped,
+and row estimates, the catalog and the vector engine reload on the new data version.
+"""
+import os, sys, json, time, argparse
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from db import write_conn, tracked_write, ensure_db
+import rollup
+
+INGEST_BATCH_ORDERS = int(os.getenv("INGEST_BATCH_ORDERS", "500"))
+WRITTEN_TABLES = ["Orders", "OrderDetails", rollup.ROLLUP_TABLE]
+
+class IngestError(RuntimeError):
+    """A batch failed and was rolled back; earlier batches stay committed."""
+
+    def __init__(self, message: str, batch: int, committed: Dict[str, Any]):
+        super().__init__(message)
+        self.batch, self.committed = batch, committed
+
+    def to_dict(self) -> dict:
+        return {"error": "ingest_failed", "reason": str(self), "batch": self.batch, "committed": self.committed}
+
+def _columns(conn, table: str) -> Dict[str, str]:
+    return {r[1].lower(): r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')}
+
+def _row(record: Dict[str, Any], columns: Dict[str, str], table: str) -> Dict[str, Any]:
+    # Column names come from the client, so only names the table actually has are accepted.
+    out = {}
+    for key, value in record.items():
+        name = columns.get(str(key).lower())
+        if name is None:
+            raise ValueError(f"Unknown {table} column: {key!r}")
+        if isinstance(value, (dict, list)):
+            raise ValueError(f"{table}.{name} must be a scalar")
+        out[name] = value
+    return out
+
+def _insert(conn, table: str, row: Dict[str, Any]):
+    names = ", ".join(f'"{c}"' for c in row)
+    marks = ", ".join("?" * len(row))
+    return conn.execute(f'INSERT INTO "{table}" ({names}) VALUES ({marks})', tuple(row.values()))
+
+def _chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _prepare(orders: Iterable[Dict[str, Any]], order_cols, line_cols) -> List[tuple]:
+    # Every order is validated before the first batch commits, so malformed input is rejected
+    # whole instead of after some batches are already in.
+    out = []
+    for order in orders:
+        if not isinstance(order, dict):
+            raise ValueError("Each order must be a JSON object")
+        order = dict(order)
+        details = order.pop("lines", None) or []
+        if not isinstance(details, list) or not all(isinstance(line, dict) for line in details):
+            raise ValueError("lines must be a list of JSON objects")
+        out.append((_row(order, order_cols, "Orders"), [_row(line, line_cols, "OrderDetails") for line in details]))
+    return out
+
+def _write_batch(conn, batch: List[tuple], order_id_col: str, line_id_col: str) -> tuple:
+    ids, lines = [], 0
+    for order, details in batch:
+        cur = _insert(conn, "Orders", order)
+        order_id = order[order_id_col] if order_id_col in order else cur.lastrowid
+        ids.append(order_id)
+        for row in details:
+            _insert(conn, "OrderDetails", {**row, line_id_col: order_id})
+            lines += 1
+    months = set()
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        months.update(r[0] for r in conn.execute(
+            f"SELECT DISTINCT STRFTIME('%Y-%m', OrderDate) FROM Orders WHERE OrderID IN ({','.join('?' * len(chunk))})",
+            chunk))
+    return len(ids), lines, months
+
+def ingest(orders: Iterable[Dict[str, Any]], batch_size: int = INGEST_BATCH_ORDERS) -> dict:
+    """Append orders (with their "lines") in batched transactions; returns counts, the months
+    touched and timings. Raises ValueError for malformed input (nothing written) and
+    IngestError if a batch fails (earlier batches stay committed)."""
+    start = time.time()
+    ensure_db()
+    rollup.ensure_fresh()  # batches only add their own months on top of an up-to-date rollup
+    committed = {"orders": 0, "lines": 0, "batches": 0}
+    months = set()
+    try:
+        with tracked_write(WRITTEN_TABLES), write_conn() as conn:
+            order_cols, line_cols = _columns(conn, "Orders"), _columns(conn, "OrderDetails")
+            if "orderid" not in order_cols or "orderid" not in line_cols:
+                raise ValueError("Orders/OrderDetails have no OrderID column")
+            prepared = _prepare(orders, order_cols, line_cols)
+            conn.execute("PRAGMA journal_mode=WAL")
+            for batch in _chunks(prepared, max(1, batch_size)):
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    n_orders, n_lines, batch_months = _write_batch(conn, batch, order_cols["orderid"], line_cols["orderid"])
+                    rollup.refresh_months(batch_months, conn=conn)
+                    conn.execute("COMMIT")
+                except Exception as e:
+                    conn.execute("ROLLBACK")
+                    raise IngestError(f"Batch {committed['batches']} rolled back: {e}", committed["batches"], dict(committed)) from e
+                committed["orders"] += n_orders
+                committed["lines"] += n_lines
+                committed["batches"] += 1
+                months |= batch_months
+            # Re-analyzes only tables whose row counts drifted enough to matter to the planner.
+            conn.execute("PRAGMA optimize")
+    finally:
+        if months:
+            _invalidate(months)
+    return {**committed, "months": sorted(m for m in months if m), "elapsed_ms": int((time.time() - start) * 1000)}
+
+def _invalidate(months: set):
+    # Result cache entries and the rollup/catalog/engine state follow the bumped table
+    # generations and data version on their own; the forecast cache is keyed on input series,
+    # so its entries for these months are dropped explicitly.
+    forecast = sys.modules.get("forecast")
+    if forecast is not None:
+        forecast.invalidate_months(months)
+    rollup.ensure_fresh()
+
+def read_orders(path: str) -> List[Dict[str, Any]]:
+    text = sys.stdin.read() if path == "-" else open(path, encoding="utf-8").read()
+    text = text.strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def main(argv: Optional[list] = None):
+    ap = argparse.ArgumentParser(description="Append Orders/OrderDetails to the Northwind DB.")
+    ap.add_argument("path", help="JSON list or NDJSON of orders with a 'lines' list; - for stdin")
+    ap.add_argument("--batch", type=int, default=INGEST_BATCH_ORDERS, help="orders per transaction")
+    args = ap.parse_args(argv)
+    print("Ingested:", ingest(read_orders(args.path), args.batch))
+
+if __name__ == "__main__":
+    main()
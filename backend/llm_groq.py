@@ -1,60 +1,115 @@
-import os, json
-from typing import Dict, Any
-from groq import Groq
+import os, json, asyncio
+from typing import Dict, Any, Tuple
+
+from metrics import metrics
+
+# The groq SDK (and httpx) are imported by the client getter on first use, so a worker
+# running with USE_LLM=false never pays for them.
 
 GROQ_MODEL = os.getenv("LLM_MODEL", "llama-3.1-8b-instant")
 USE_LLM = os.getenv("USE_LLM", "false").lower() in ("1","true","yes")
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "64"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
 
-def get_client():
+# One client (and therefore one HTTP connection pool) per process, shared by every request.
+_async_client = None
+_async_sem = None
+
+def _api_key() -> str:
     key = os.getenv("GROQ_API_KEY")
     if not key:
         raise RuntimeError("GROQ_API_KEY not set")
-    return Groq(api_key=key)
-
-def chat_json(system: str, user: str, temperature: float = 0.2) -> Dict[str, Any]:
-    client = get_client()
-    resp = client.chat.completions.create(
-        model=GROQ_MODEL,
-        temperature=temperature,
-        messages=[{"role":"system","content":system},{"role":"user","content":user}],
-        response_format={"type":"json_object"},
-    )
-    txt = resp.choices[0].message.content
-    return json.loads(txt)
-
-def chat_text(system: str, user: str, temperature: float = 0.2) -> str:
-    client = get_client()
-    resp = client.chat.completions.create(
-        model=GROQ_MODEL,
-        temperature=temperature,
-        messages=[{"role":"system","content":system},{"role":"user","content":user}],
-    )
+    return key
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        import httpx
+        from groq import AsyncGroq
+        limits = httpx.Limits(max_connections=LLM_CONCURRENCY, max_keepalive_connections=LLM_CONCURRENCY)
+        _async_client = AsyncGroq(api_key=_api_key(), timeout=LLM_TIMEOUT,
+                                  http_client=httpx.AsyncClient(limits=limits, timeout=LLM_TIMEOUT))
+    return _async_client
+
+def _llm_slot() -> asyncio.Semaphore:
+    global _async_sem
+    if _async_sem is None:
+        _async_sem = asyncio.Semaphore(LLM_CONCURRENCY)
+    return _async_sem
+
+def _messages(system: str, user: str):
+    return [{"role":"system","content":system},{"role":"user","content":user}]
+
+def _record(call: str, resp=None):
+    if resp is None:
+        metrics.inc("llm_requests_total", call=call, outcome="error")
+        return
+    metrics.inc("llm_requests_total", call=call, outcome="ok")
+    usage = getattr(resp, "usage", None)
+    if usage is not None:
+        metrics.inc("llm_tokens_total", usage.prompt_tokens or 0, model=GROQ_MODEL, type="prompt")
+        metrics.inc("llm_tokens_total", usage.completion_tokens or 0, model=GROQ_MODEL, type="completion")
+
+async def _acreate(call: str, **kwargs):
+    async with _llm_slot():
+        try:
+            resp = await get_async_client().chat.completions.create(model=GROQ_MODEL, **kwargs)
+        except Exception:
+            _record(call)
+            raise
+    _record(call, resp)
+    return resp
+
+async def achat_json(system: str, user: str, temperature: float = 0.2) -> Dict[str, Any]:
+    resp = await _acreate("json", temperature=temperature, messages=_messages(system, user),
+                          response_format={"type":"json_object"})
+    return json.loads(resp.choices[0].message.content)
+
+async def achat_text(system: str, user: str, temperature: float = 0.2) -> str:
+    resp = await _acreate("text", temperature=temperature, messages=_messages(system, user))
     return resp.choices[0].message.content or ""
 
-def parse_intent(question: str, schema_json: str) -> Dict[str, Any]:
+# ---- Prompts ----
+
+def _intent_prompt(question: str, schema_json: str) -> Tuple[str, str]:
     system = ("You are a strict planner for Northwind SQLite analytics. "
               "Return ONLY JSON: {intent, group_by, metric, filters, top_n, periods?}. "
               "intent∈{aggregate,timeseries,forecast}; group_by∈{month,country,category,employee,product,none}. "
               "metric defaults to revenue.")
     user = f"SCHEMA:\\n{schema_json}\\n\\nQUESTION:\\n{question}"
-    return chat_json(system, user)
+    return system, user
 
-def make_sql(plan: Dict[str, Any], schema_json: str) -> str:
+def _sql_prompt(plan: Dict[str, Any], schema_json: str) -> Tuple[str, str]:
     rules = ("Generate a SINGLE SQLite SELECT for Northwind. Use ONLY these tables/columns. "
              "Use STRFTIME('%Y', Orders.OrderDate) for YEAR filters. "
              "Revenue = SUM(OrderDetails.UnitPrice*OrderDetails.Quantity*(1-OrderDetails.Discount)). "
              "Return ONLY SQL, no prose.")
+    if "SalesRollup(" in schema_json:
+        rules += (" SalesRollup is a pre-aggregated copy of that revenue by month ('YYYY-MM'), country, "
+                  "category_id, product_id and employee_id; prefer SUM(SalesRollup.revenue) over the "
+                  "Orders/OrderDetails join whenever no day-level or customer-level detail is needed.")
     system = rules + "\\n\\nALLOWED SCHEMA:\\n" + schema_json
-    from json import dumps
-    return chat_text(system, dumps(plan, ensure_ascii=False))
+    return system, json.dumps(plan, ensure_ascii=False)
 
-def write_insight(metrics_json: str, top_rows_json: str) -> str:
+def _insight_prompt(metrics_json: str, top_rows_json: str) -> Tuple[str, str]:
     system = "Write 1–3 concise sentences with exact numbers and % where possible. No fluff."
     user = f"METRICS:\\n{metrics_json}\\n\\nTOP_ROWS:\\n{top_rows_json}"
-    return chat_text(system, user, temperature=0.1)
+    return system, user
 
-def repair_sql(error: str, bad_sql: str, schema_json: str) -> str:
+def _repair_prompt(error: str, bad_sql: str, schema_json: str) -> Tuple[str, str]:
     system = ("You fix SQLite SELECT queries. Return ONLY the corrected SQL. "
               "Use only given schema; no DDL/DML.")
     user = f"SCHEMA:\\n{schema_json}\\n\\nERROR:\\n{error}\\n\\nSQL:\\n{bad_sql}"
-    return chat_text(system, user)
\ No newline at end of file
+    return system, user
+
+async def aparse_intent(question: str, schema_json: str) -> Dict[str, Any]:
+    return await achat_json(*_intent_prompt(question, schema_json))
+
+async def amake_sql(plan: Dict[str, Any], schema_json: str) -> str:
+    return await achat_text(*_sql_prompt(plan, schema_json))
+
+async def awrite_insight(metrics_json: str, top_rows_json: str) -> str:
+    return await achat_text(*_insight_prompt(metrics_json, top_rows_json), temperature=0.1)
+
+async def arepair_sql(error: str, bad_sql: str, schema_json: str) -> str:
+    return await achat_text(*_repair_prompt(error, bad_sql, schema_json))
@@ -0,0 +1,143 @@
+import time, threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+PREFIX = "northwind_"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+
+# ---- Registry ----
+# Minimal Prometheus text exposition: counters and fixed-bucket histograms keyed by
+# (name, sorted labels). Collectors add gauges computed at scrape time from existing stats().
+
+HELP = {
+    "stage_duration_seconds": ("histogram", "Time spent per pipeline stage."),
+    "chat_duration_seconds": ("histogram", "End-to-end answer time by path and template."),
+    "http_request_duration_seconds": ("histogram", "HTTP handler time until the response starts."),
+    "chats_total": ("counter", "Answers produced, by path and template."),
+    "fallbacks_total": ("counter", "LLM attempts that fell back to the heuristic path, by reason."),
+    "hedges_total": ("counter", "Hedged LLM/heuristic races, by winning path and reason."),
+    "coalesced_total": ("counter", "/chat requests answered by an identical in-flight request."),
+    "llm_requests_total": ("counter", "Groq completions, by call kind and outcome."),
+    "llm_tokens_total": ("counter", "Groq token usage, by model and token type."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def _fmt(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+class Metrics:
+    def __init__(self, buckets: Iterable[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._hists: Dict[str, Dict[Labels, List[float]]] = {}  # bucket counts..., sum, count
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]] = []
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _labels(labels)
+        i = bisect_left(self.buckets, seconds)
+        with self._lock:
+            h = self._hists.setdefault(name, {}).get(key)
+            if h is None:
+                h = self._hists[name][key] = [0.0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    def collector(self, fn):
+        # fn() -> iterable of (name, type, help, labels, value), evaluated on every scrape.
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        out = []
+        with self._lock:
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            hists = {n: {k: list(v) for k, v in s.items()} for n, s in self._hists.items()}
+        for name, series in sorted(counters.items()):
+            kind, text = HELP.get(name, ("counter", name))
+            out += [f"# HELP {PREFIX}{name} {text}", f"# TYPE {PREFIX}{name} {kind}"]
+            out += [f"{PREFIX}{name}{_fmt(k)} {v:g}" for k, v in sorted(series.items())]
+        for name, series in sorted(hists.items()):
+            kind, text = HELP.get(name, ("histogram", name))
+            out += [f"# HELP {PREFIX}{name} {text}", f"# TYPE {PREFIX}{name} histogram"]
+            for k, h in sorted(series.items()):
+                running = 0.0
+                for le, n in zip(self.buckets, h):
+                    running += n
+                    out.append(f"{PREFIX}{name}_bucket{_fmt(k, ('le', f'{le:g}'))} {running:g}")
+                out.append(f"{PREFIX}{name}_bucket{_fmt(k, ('le', '+Inf'))} {h[-1]:g}")
+                out.append(f"{PREFIX}{name}_sum{_fmt(k)} {h[-2]:.6f}")
+                out.append(f"{PREFIX}{name}_count{_fmt(k)} {h[-1]:g}")
+        families: Dict[str, Tuple[str, str, List[str]]] = {}
+        for fn in self._collectors:
+            try:
+                samples = list(fn())
+            except Exception as e:
+                print("Metrics collector failed:", e)
+                continue
+            for name, kind, text, labels, value in samples:
+                lines = families.setdefault(name, (kind, text, []))[2]
+                lines.append(f"{PREFIX}{name}{_fmt(_labels(labels))} {float(value):g}")
+        for name, (kind, text, lines) in families.items():
+            out += [f"# HELP {PREFIX}{name} {text}", f"# TYPE {PREFIX}{name} {kind}"] + lines
+        return "\n".join(out) + "\n"
+
+metrics = Metrics()
+
+# ---- Request tracing ----
+# A trace is a per-request list of (stage, ms) carried in a context variable; stage() records
+# into it and into the stage histogram, and server_timing() renders it as a header value.
+
+_trace: ContextVar[Optional[Dict[str, Any]]] = ContextVar("trace", default=None)
+
+def start_trace() -> Dict[str, Any]:
+    trace = {"stages": [], "path": "none"}
+    _trace.set(trace)
+    return trace
+
+def current_trace() -> Optional[Dict[str, Any]]:
+    return _trace.get()
+
+def set_path(path: str):
+    trace = _trace.get()
+    if trace is not None:
+        trace["path"] = path
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        trace = _trace.get()
+        if trace is not None:
+            trace["stages"].append((name, elapsed * 1000))
+        metrics.observe("stage_duration_seconds", elapsed, stage=name, path=trace["path"] if trace else "none")
+
+async def timed(name: str, awaitable):
+    with stage(name):
+        return await awaitable
+
+def server_timing(trace: Optional[Dict[str, Any]]) -> str:
+    if not trace:
+        return ""
+    return ", ".join(f"{name};dur={ms:.1f}" for name, ms in trace["stages"])
@@ -0,0 +1,125 @@
+import os, re, json, time, sqlite3, threading
+from typing import Any, Optional
+
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH", os.path.join(os.path.dirname(__file__), "data", "llm_cache.sqlite"))
+PLAN_CACHE_MAX = int(os.getenv("PLAN_CACHE_MAX", "5000"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", str(30 * 86400)))
+
+# Comparison operators change the SQL ("> 10" vs "< 10"), so they survive normalization.
+_PUNCT = re.compile(r"[^\w\s%.<>=!-]+|!(?!=)")
+_OPS = re.compile(r"\s*(!=|<>|<=|>=|==|<|>|=)\s*")
+_SPACE = re.compile(r"\s+")
+
+def normalize_question(question: str) -> str:
+    q = _OPS.sub(r" \1 ", _PUNCT.sub(" ", question.lower()))
+    return _SPACE.sub(" ", q).strip(" .")
+
+class PlanCache:
+    """LLM intent plans and validated SQL, persisted in a SQLite side-table.
+
+    The file lives next to the analytics DB (not inside it) so the read pool can stay
+    query_only; WAL mode lets every uvicorn worker share it.
+    """
+
+    _TOUCH_AFTER = 60.0
+    _EVICT_EVERY = 50
+
+    def __init__(self, path: str = PLAN_CACHE_PATH, max_entries: int = PLAN_CACHE_MAX, ttl: float = PLAN_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._conn = None
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._stats = {"hits": 0, "misses": 0, "puts": 0, "evictions": 0, "errors": 0}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+CREATE TABLE IF NOT EXISTS llm_cache (
+  kind TEXT NOT NULL,
+  qkey TEXT NOT NULL,
+  fingerprint TEXT NOT NULL,
+  value TEXT NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 0,
+  created REAL NOT NULL,
+  last_used REAL NOT NULL,
+  PRIMARY KEY (kind, qkey, fingerprint)
+)""")
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache(last_used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, kind: str, question: str, fingerprint: str) -> Optional[Any]:
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._db()
+                row = conn.execute(
+                    "SELECT value, created, last_used FROM llm_cache WHERE kind=? AND qkey=? AND fingerprint=?",
+                    (kind, key, fingerprint)).fetchone()
+                if row is None or (self.ttl and row[1] + self.ttl < now):
+                    self._stats["misses"] += 1
+                    return None
+                if now - row[2] > self._TOUCH_AFTER:
+                    conn.execute("UPDATE llm_cache SET last_used=?, hits=hits+1 WHERE kind=? AND qkey=? AND fingerprint=?",
+                                 (now, kind, key, fingerprint))
+                    conn.commit()
+                self._stats["hits"] += 1
+                return json.loads(row[0])
+            except sqlite3.Error:
+                self._stats["errors"] += 1
+                return None
+
+    def put(self, kind: str, question: str, fingerprint: str, value: Any):
+        key = normalize_question(question)
+        now = time.time()
+        with self._lock:
+            try:
+                conn = self._db()
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache(kind, qkey, fingerprint, value, hits, created, last_used) VALUES (?,?,?,?,0,?,?)",
+                    (kind, key, fingerprint, json.dumps(value, ensure_ascii=False), now, now))
+                self._stats["puts"] += 1
+                self._puts += 1
+                if self._puts % self._EVICT_EVERY == 0:
+                    self._evict(conn, now)
+                conn.commit()
+            except sqlite3.Error:
+                self._stats["errors"] += 1
+
+    def discard(self, kind: str, question: str, fingerprint: str):
+        with self._lock:
+            try:
+                conn = self._db()
+                conn.execute("DELETE FROM llm_cache WHERE kind=? AND qkey=? AND fingerprint=?",
+                             (kind, normalize_question(question), fingerprint))
+                conn.commit()
+            except sqlite3.Error:
+                self._stats["errors"] += 1
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        cur = conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,)) if self.ttl else None
+        evicted = cur.rowcount if cur is not None else 0
+        count = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        if count > self.max_entries:
+            cur = conn.execute(
+                "DELETE FROM llm_cache WHERE rowid IN (SELECT rowid FROM llm_cache ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,))
+            evicted += cur.rowcount
+        self._stats["evictions"] += evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = dict(self._stats)
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 4) if lookups else 0.0
+        return out
+
+plan_cache = PlanCache()
@@ -0,0 +1,47 @@
+import os, re
+from typing import Dict, List
+
+from db import explain, table_rows
+
+PLAN_GUARD = os.getenv("PLAN_GUARD", "log").lower()  # off | log | reject
+PLAN_GUARD_MIN_ROWS = int(os.getenv("PLAN_GUARD_MIN_ROWS", "50000"))
+
+# FROM/JOIN/comma <table> [AS] <alias>; EXPLAIN QUERY PLAN reports aliases, not table names.
+_SOURCE = re.compile(
+    r'(?:\bFROM|\bJOIN|,)\s*("[^"]+"|\[[^\]]+\]|`[^`]+`|\w+\b(?![.(]))(?:\s+(?:AS\s+)?(?!ON\b|USING\b|WHERE\b|JOIN\b|GROUP\b|ORDER\b|LIMIT\b|LEFT\b|INNER\b|CROSS\b|NATURAL\b)(\w+))?',
+    re.IGNORECASE)
+_SCAN = re.compile(r"^SCAN (\S+)(.*)$")
+
+def _aliases(sql: str) -> Dict[str, str]:
+    out = {}
+    for m in _SOURCE.finditer(sql):
+        table = m.group(1).strip('"[]`')
+        out.setdefault(table, table)
+        if m.group(2):
+            out.setdefault(m.group(2), table)
+    return out
+
+def analyze_plan(sql: str, plan: List[str]) -> List[str]:
+    """Flag unindexed full scans and temp b-trees that touch tables above PLAN_GUARD_MIN_ROWS."""
+    rows = table_rows()
+    aliases = _aliases(sql)
+    large = lambda name: rows.get(aliases.get(name, name), 0) >= PLAN_GUARD_MIN_ROWS
+    issues, touches_large = [], False
+    for step in plan:
+        m = _SCAN.match(step)
+        if m:
+            if large(m.group(1)):
+                touches_large = True
+                if "INDEX" not in m.group(2):
+                    issues.append(f"full scan of {aliases.get(m.group(1), m.group(1))}")
+        elif step.startswith("SEARCH "):
+            touches_large = touches_large or large(step.split()[1])
+    if touches_large:
+        issues += [step.lower() for step in plan if step.startswith("USE TEMP B-TREE")]
+    return issues
+
+def check_plan(sql: str) -> Dict[str, List[str]]:
+    if PLAN_GUARD == "off":
+        return {}
+    plan = explain(sql)
+    return {"plan": plan, "plan_issues": analyze_plan(sql, plan)}
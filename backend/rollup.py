@@ -0,0 +1,196 @@
+import os, time, threading
+from typing import Iterable, Optional
+
+from db import write_conn, data_version
+
+ROLLUP_ENABLED = os.getenv("ROLLUP_ENABLED", "true").lower() in ("1","true","yes")
+ROLLUP_TABLE = "SalesRollup"
+
+# Revenue pre-aggregated at month × country × category × product × employee grain.
+# Rows are rebuilt per month, so NULL keys need no special upsert handling and a
+# refresh is idempotent even if two workers race on it. has_customer separates orders whose
+# customer has no Country (kept as a NULL group, as the base template does) from orders whose
+# CustomerID matches no customer (dropped by the base template's inner join).
+DDL = f"""
+CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE} (
+  month TEXT,
+  country TEXT,
+  has_customer INTEGER NOT NULL,
+  category_id INTEGER,
+  product_id INTEGER,
+  employee_id INTEGER,
+  revenue REAL NOT NULL,
+  quantity INTEGER NOT NULL,
+  lines INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_salesrollup_month ON {ROLLUP_TABLE}(month);
+CREATE TABLE IF NOT EXISTS {ROLLUP_TABLE}State (
+  id INTEGER PRIMARY KEY CHECK (id = 1),
+  last_order_id INTEGER,
+  orders INTEGER,
+  lines INTEGER,
+  refreshed_at REAL
+);
+"""
+# Columns a rollup built by an older version (or carried in by a swapped file) may lack.
+REQUIRED = {ROLLUP_TABLE: "has_customer", f"{ROLLUP_TABLE}State": "orders"}
+
+SELECT_ROLLUP = """
+SELECT STRFTIME('%Y-%m', o.OrderDate) AS month,
+       c.Country AS country,
+       c.CustomerID IS NOT NULL AS has_customer,
+       p.CategoryID AS category_id,
+       od.ProductID AS product_id,
+       o.EmployeeID AS employee_id,
+       SUM(od.UnitPrice*od.Quantity*(1-od.Discount)) AS revenue,
+       SUM(od.Quantity) AS quantity,
+       COUNT(*) AS lines
+FROM Orders o
+JOIN OrderDetails od ON od.OrderID=o.OrderID
+LEFT JOIN Customers c ON c.CustomerID=o.CustomerID
+LEFT JOIN Products p ON p.ProductID=od.ProductID
+{where}
+GROUP BY 1, 2, 3, 4, 5, 6
+"""
+
+_state = {"ready": False, "token": None, "refreshes": 0, "months_rebuilt": 0, "last_ms": 0}
+_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+
+def _insert(conn, where: str = "", params: tuple = ()):
+    conn.execute(f"INSERT INTO {ROLLUP_TABLE} " + SELECT_ROLLUP.format(where=where), params)
+
+def _rebuild_months(conn, months: Iterable[Optional[str]]) -> int:
+    months = sorted(set(months), key=lambda m: (m is not None, m or ""))
+    dated = [m for m in months if m is not None]
+    if dated:
+        marks = ",".join("?" * len(dated))
+        conn.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE month IN ({marks})", dated)
+        _insert(conn, f"WHERE STRFTIME('%Y-%m', o.OrderDate) IN ({marks})", tuple(dated))
+    if None in months:
+        conn.execute(f"DELETE FROM {ROLLUP_TABLE} WHERE month IS NULL")
+        _insert(conn, "WHERE STRFTIME('%Y-%m', o.OrderDate) IS NULL")
+    return len(months)
+
+def _set_watermark(conn, last_order_id):
+    orders = conn.execute("SELECT COUNT(*) FROM Orders").fetchone()[0]
+    lines = conn.execute("SELECT COUNT(*) FROM OrderDetails").fetchone()[0]
+    conn.execute(f"INSERT OR REPLACE INTO {ROLLUP_TABLE}State(id, last_order_id, orders, lines, refreshed_at) "
+                 "VALUES (1, ?, ?, ?, ?)", (last_order_id, orders, lines, time.time()))
+
+def _current(conn) -> bool:
+    # Both tables exist with this version's columns.
+    for table, column in REQUIRED.items():
+        if column not in [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]:
+            return False
+    return True
+
+def _migrate(conn):
+    # Runs before BEGIN (executescript commits); an outdated rollup is dropped and built again.
+    if not _current(conn):
+        conn.execute(f"DROP TABLE IF EXISTS {ROLLUP_TABLE}")
+        conn.execute(f"DROP TABLE IF EXISTS {ROLLUP_TABLE}State")
+    conn.executescript(DDL)
+
+def _appended(conn, state) -> bool:
+    # True if the only change since the last refresh is new orders (with their lines) above
+    # the watermark; deletes, rewritten history or a swapped-in file fail the count check.
+    watermark, orders, lines = state
+    new_orders = conn.execute("SELECT COUNT(*) FROM Orders WHERE OrderID > ?", (watermark,)).fetchone()[0]
+    new_lines = conn.execute("SELECT COUNT(*) FROM OrderDetails WHERE OrderID > ?", (watermark,)).fetchone()[0]
+    return (orders is not None and lines is not None
+            and conn.execute("SELECT COUNT(*) FROM Orders").fetchone()[0] == orders + new_orders
+            and conn.execute("SELECT COUNT(*) FROM OrderDetails").fetchone()[0] == lines + new_lines)
+
+def refresh(full: bool = False) -> dict:
+    """Bring the rollup up to date: rebuild only the months touched by orders appended above
+    the OrderID watermark, or everything on first run or when the change is not a pure append."""
+    start = time.time()
+    rebuilt = 0
+    with write_conn() as conn:
+        _migrate(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            state = conn.execute(f"SELECT last_order_id, orders, lines FROM {ROLLUP_TABLE}State WHERE id=1").fetchone()
+            max_id = conn.execute("SELECT MAX(OrderID) FROM Orders").fetchone()[0] or 0
+            if full or state is None or state[0] is None or max_id < state[0] or not _appended(conn, state):
+                if state is not None and not full:
+                    print("Rollup: source changed beyond appends above the watermark, rebuilding in full.")
+                conn.execute(f"DELETE FROM {ROLLUP_TABLE}")
+                _insert(conn)
+                rebuilt = conn.execute(f"SELECT COUNT(DISTINCT IFNULL(month, '')) FROM {ROLLUP_TABLE}").fetchone()[0]
+                _set_watermark(conn, max_id)
+            elif max_id > state[0]:
+                months = [r[0] for r in conn.execute(
+                    "SELECT DISTINCT STRFTIME('%Y-%m', OrderDate) FROM Orders WHERE OrderID > ?", (state[0],))]
+                rebuilt = _rebuild_months(conn, months)
+                _set_watermark(conn, max_id)
+            # Otherwise nothing the rollup covers changed (another worker refreshed it, or a
+            # write to some other table); no write, so workers do not keep bumping each other.
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    with _lock:
+        _state.update(ready=True, token=data_version(), last_ms=int((time.time() - start) * 1000))
+        _state["refreshes"] += 1
+        _state["months_rebuilt"] += rebuilt
+    return {"months_rebuilt": rebuilt, "elapsed_ms": _state["last_ms"]}
+
+def _rebuild_touched(conn, months: Iterable[Optional[str]]) -> int:
+    # The given months plus any above the watermark, so moving the watermark to MAX(OrderID)
+    # never skips orders some other writer appended without maintaining the rollup. The stored
+    # row counts are taken as-is, so callers run ensure_fresh first to fold in earlier changes.
+    row = conn.execute(f"SELECT last_order_id FROM {ROLLUP_TABLE}State WHERE id=1").fetchone()
+    months = set(months)
+    if row and row[0] is not None:
+        months.update(r[0] for r in conn.execute(
+            "SELECT DISTINCT STRFTIME('%Y-%m', OrderDate) FROM Orders WHERE OrderID > ?", (row[0],)))
+    n = _rebuild_months(conn, months)
+    max_id = conn.execute("SELECT MAX(OrderID) FROM Orders").fetchone()[0]
+    _set_watermark(conn, max_id or 0)
+    return n
+
+def refresh_months(months: Iterable[Optional[str]], conn=None) -> int:
+    """Explicit maintenance for writers that know which months they touched. With `conn`, the
+    months are rebuilt inside the caller's open transaction, if the rollup exists (otherwise
+    the next ensure_fresh builds it in full)."""
+    if conn is not None:
+        if not ROLLUP_ENABLED or not _current(conn):
+            return 0
+        return _rebuild_touched(conn, months)
+    with write_conn() as conn:
+        _migrate(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            n = _rebuild_touched(conn, months)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+    with _lock:
+        _state.update(ready=True, token=data_version())
+        _state["months_rebuilt"] += n
+    return n
+
+def ensure_fresh() -> bool:
+    # Cheap on the hot path: only a stat() unless the database file changed since the last refresh.
+    if not ROLLUP_ENABLED:
+        return False
+    if _state["token"] == data_version():
+        return _state["ready"]
+    with _refresh_lock:
+        if _state["token"] != data_version():
+            try:
+                refresh()
+            except Exception as e:
+                print("Rollup refresh failed, serving from base tables:", e)
+                with _lock:
+                    _state.update(ready=False, token=data_version())
+    return _state["ready"]
+
+def stats() -> dict:
+    with _lock:
+        out = {k: v for k, v in _state.items() if k != "token"}
+    out["enabled"] = ROLLUP_ENABLED
+    return out
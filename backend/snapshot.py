@@ -0,0 +1,65 @@
+"""Compressed, versioned Northwind snapshots.
+
+    python snapshot.py --from data/northwind_sf1.sqlite      # writes data/northwind.v1.sqlite.gz
+
+A snapshot is a gzipped, VACUUMed SQLite image (indexes and ANALYZE stats included) stamped
+with PRAGMA user_version. With NORTHWIND_SEED=snapshot, db.ensure_db restores it instead of
+downloading, so a fresh worker gets a usable database without network access.
+
+The bundled data/northwind.v1.sqlite.gz is synthetic (datagen.py, scale 1, seed 42): Northwind's
+shape and volume with generated names ("Western Imports 74"), not the real dataset.
+"""
+import os, gzip, time, sqlite3, argparse
+from contextlib import closing
+from typing import Optional
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PATH = os.getenv("NORTHWIND_SNAPSHOT") or os.path.join(
+    os.path.dirname(__file__), "data", f"northwind.v{SNAPSHOT_VERSION}.sqlite.gz")
+
+def build(src: str, dest: str = SNAPSHOT_PATH, version: int = SNAPSHOT_VERSION) -> dict:
+    mem = sqlite3.connect(":memory:")
+    with closing(sqlite3.connect(src)) as conn:
+        conn.backup(mem)
+    mem.execute(f"PRAGMA user_version={int(version)}")
+    # Also resets the header's WAL file-format bytes a WAL-mode source leaves in the copy.
+    mem.execute("VACUUM")
+    raw = mem.serialize()
+    mem.close()
+    tmp = dest + ".tmp"
+    # mtime=0 keeps the archive byte-identical for identical databases.
+    with open(tmp, "wb") as f, gzip.GzipFile(fileobj=f, mode="wb", compresslevel=9, mtime=0) as gz:
+        gz.write(raw)
+    os.replace(tmp, dest)
+    out = {"path": dest, "version": version, "bytes": len(raw), "compressed": os.path.getsize(dest)}
+    print("Snapshot written:", out)
+    return out
+
+def restore(dest: str, src: str = SNAPSHOT_PATH) -> dict:
+    """Decompress into memory and copy into `dest` with the backup API; renamed into place."""
+    start = time.time()
+    with gzip.open(src, "rb") as f:
+        raw = f.read()
+    tmp = dest + ".restore"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    mem = sqlite3.connect(":memory:")
+    mem.deserialize(raw)
+    version = mem.execute("PRAGMA user_version").fetchone()[0]
+    out = sqlite3.connect(tmp)
+    mem.backup(out)
+    out.close()
+    mem.close()
+    os.replace(tmp, dest)
+    return {"version": version, "bytes": len(raw), "elapsed_ms": int((time.time() - start) * 1000)}
+
+def main(argv: Optional[list] = None):
+    ap = argparse.ArgumentParser(description="Build a compressed Northwind snapshot.")
+    ap.add_argument("--from", dest="src", required=True, help="source SQLite database")
+    ap.add_argument("--out", default=SNAPSHOT_PATH)
+    ap.add_argument("--version", type=int, default=SNAPSHOT_VERSION)
+    args = ap.parse_args(argv)
+    build(args.src, args.out, args.version)
+
+if __name__ == "__main__":
+    main()
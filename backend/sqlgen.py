@@ -1,7 +1,9 @@
 import re
 from typing import Dict, Any
 
-def generate_sql_and_chart(question: str) -> Dict[str, Any]:
+def generate_sql_and_chart(question: str, rollup: bool = False) -> Dict[str, Any]:
+    # rollup=True routes every template except customers to the pre-aggregated SalesRollup
+    # table (see rollup.py), which holds a few hundred rows instead of the full fact join.
     q = question.lower().strip()
 
     # Helper: extract "top N" if present; default = 5 (for top lists)
@@ -12,6 +14,12 @@ def generate_sql_and_chart(question: str) -> Dict[str, Any]:
     if ("monthly" in q) or ("per month" in q) or ("by month" in q) or ("trend" in q):
         return {
             "sql": """
+SELECT month,
+       ROUND(SUM(revenue),2) AS revenue
+FROM SalesRollup
+GROUP BY 1
+ORDER BY 1;
+""".strip() if rollup else """
 SELECT STRFTIME('%Y-%m', o.OrderDate) AS month,
        ROUND(SUM(od.UnitPrice*od.Quantity*(1-od.Discount)),2) AS revenue
 FROM Orders o
@@ -29,12 +37,20 @@ ORDER BY 1;
             "forecast": ("forecast" in q or "next" in q),
             "periods": 3,
             "insight": "Monthly revenue trend with optional forecast.",
+            "template": "monthly",
         }
 
     # ---- COUNTRY MIX (explicit pie support) ----
     if ("share" in q) or ("by country" in q) or ("country" in q and "pie" in q):
         return {
             "sql": """
+SELECT country,
+       ROUND(SUM(revenue),2) AS revenue
+FROM SalesRollup
+WHERE has_customer
+GROUP BY country
+ORDER BY revenue DESC;
+""".strip() if rollup else """
 SELECT c.Country AS country,
        ROUND(SUM(od.UnitPrice*od.Quantity*(1-od.Discount)),2) AS revenue
 FROM Orders o
@@ -51,12 +67,20 @@ ORDER BY revenue DESC;
                 "subtitle": "Northwind • USD"
             },
             "insight": "Country mix of revenue with % shares.",
+            "template": "country",
         }
 
     # ---- CATEGORY MIX (pie) ----
     if ("category" in q) and (("share" in q) or ("pie" in q) or ("by category" in q)):
         return {
             "sql": """
+SELECT c.CategoryName AS category,
+       ROUND(SUM(r.revenue),2) AS revenue
+FROM SalesRollup r
+JOIN Categories c ON c.CategoryID=r.category_id
+GROUP BY c.CategoryName
+ORDER BY revenue DESC;
+""".strip() if rollup else """
 SELECT c.CategoryName AS category,
        ROUND(SUM(od.UnitPrice*od.Quantity*(1-od.Discount)),2) AS revenue
 FROM Orders o
@@ -74,6 +98,7 @@ ORDER BY revenue DESC;
                 "subtitle": "Northwind • USD"
             },
             "insight": "Category mix of revenue with % shares.",
+            "template": "category",
         }
 
     # ---- CUSTOMERS (bar by default; pie if asked) ----
@@ -98,6 +123,8 @@ LIMIT {topn};
                 "subtitle": "Northwind • USD"
             },
             "insight": (f"Top {topn} customers by revenue." if not want_pie else f"Top {topn} customers as a revenue share."),
+            "template": "customer",
+            "limit": topn,
         }
 
     # ---- PRODUCTS (bar by default; pie if asked) ----
@@ -105,6 +132,14 @@ LIMIT {topn};
         want_pie = ("pie" in q) or ("share" in q)
         return {
             "sql": f"""
+SELECT p.ProductName AS product,
+       ROUND(SUM(r.revenue),2) AS revenue
+FROM SalesRollup r
+JOIN Products p ON p.ProductID=r.product_id
+GROUP BY p.ProductName
+ORDER BY revenue DESC
+LIMIT {topn};
+""".strip() if rollup else f"""
 SELECT p.ProductName AS product,
        ROUND(SUM(od.UnitPrice*od.Quantity*(1-od.Discount)),2) AS revenue
 FROM Orders o
@@ -122,12 +157,22 @@ LIMIT {topn};
                 "subtitle": "Northwind • USD"
             },
             "insight": (f"Top {topn} products by revenue." if not want_pie else f"Top {topn} products as a revenue share."),
+            "template": "product",
+            "limit": topn,
         }
 
     # ---- EMPLOYEES (bar) ----
     if "employee" in q or "salesperson" in q or "rep" in q:
         return {
             "sql": f"""
+SELECT (e.FirstName || ' ' || e.LastName) AS employee,
+       ROUND(SUM(r.revenue),2) AS revenue
+FROM SalesRollup r
+JOIN Employees e ON e.EmployeeID=r.employee_id
+GROUP BY employee
+ORDER BY revenue DESC
+LIMIT {topn};
+""".strip() if rollup else f"""
 SELECT (e.FirstName || ' ' || e.LastName) AS employee,
        ROUND(SUM(od.UnitPrice*od.Quantity*(1-od.Discount)),2) AS revenue
 FROM Orders o
@@ -145,11 +190,21 @@ LIMIT {topn};
                 "subtitle": "Northwind • USD"
             },
             "insight": f"Top {topn} employees by total sales.",
+            "template": "employee",
+            "limit": topn,
         }
 
     # ---- DEFAULT (top products bar) ----
     return {
         "sql": """
+SELECT p.ProductName AS item,
+       ROUND(SUM(r.revenue),2) AS revenue
+FROM SalesRollup r
+JOIN Products p ON p.ProductID=r.product_id
+GROUP BY p.ProductName
+ORDER BY revenue DESC
+LIMIT 10;
+""".strip() if rollup else """
 SELECT p.ProductName AS item,
        ROUND(SUM(od.UnitPrice*od.Quantity*(1-od.Discount)),2) AS revenue
 FROM Orders o
@@ -167,4 +222,6 @@ LIMIT 10;
             "subtitle": "Northwind • USD"
         },
         "insight": "Top items by revenue.",
+        "template": "default",
+        "limit": 10,
     }
@@ -0,0 +1,26 @@
+"""Shared setup for the backend tests (python -m unittest discover -s tests, from backend/).
+
+Imported before any backend module: the modules read their config from the environment at
+import time, so every test module shares one temporary synthetic database (datagen, scale 1,
+seeded on first use) and a throwaway plan cache.
+"""
+import os, sys, atexit, shutil, sqlite3, tempfile
+
+TMP = tempfile.mkdtemp(prefix="northwind-tests-")
+atexit.register(shutil.rmtree, TMP, True)
+os.environ.update(NORTHWIND_DB=os.path.join(TMP, "northwind.sqlite"), NORTHWIND_SEED="synthetic",
+                  NORTHWIND_SCALE="1", DB_SERVE_MODE="file", USE_LLM="false",
+                  PLAN_CACHE_PATH=os.path.join(TMP, "llm_cache.sqlite"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import db
+
+def scratch_copy(name: str, journal_mode: str = "delete") -> str:
+    """A private copy of the test DB, for tests that need their own file."""
+    db.ensure_db()
+    path = os.path.join(TMP, name)
+    shutil.copy(db.DB_PATH, path)
+    conn = sqlite3.connect(path)
+    conn.execute(f"PRAGMA journal_mode={journal_mode}")
+    conn.close()
+    return path
@@ -0,0 +1,39 @@
+"""NumPy engine vs the template SQL it replaces."""
+import sqlite3, unittest
+
+import support  # noqa: F401
+import db, engine
+from sqlgen import generate_sql_and_chart
+
+QUESTIONS = {
+    "monthly": "Monthly sales trend",
+    "country": "Sales share by country",
+    "category": "Sales by category",
+    "customer": "Top 5 customers",
+    "product": "Top 5 products by revenue",
+    "employee": "Top 3 employees by sales",
+    "default": "What sells best?",
+}
+# SQLite < 3.43 sums REAL naively in scan order, so a total on a half cent can round 0.01 apart.
+TOLERANCE = 0.0 if sqlite3.sqlite_version_info >= (3, 43) else 0.01 + 1e-9
+
+class EngineParityTest(unittest.TestCase):
+    def test_templates_match_sql(self):
+        vec = engine.get_engine()
+        self.assertIsNotNone(vec)
+        for template, question in QUESTIONS.items():
+            with self.subTest(template=template):
+                plan = generate_sql_and_chart(question)
+                self.assertEqual(plan["template"], template)
+                cols, rows = db.run_query(plan["sql"])
+                got_cols, got_rows = vec.answer(template, plan.get("limit"))
+                self.assertEqual(got_cols, cols)
+                self.assertEqual([r[0] for r in got_rows], [r[0] for r in rows])
+                for got, want in zip(got_rows, rows):
+                    if want[1] is None or got[1] is None:
+                        self.assertEqual(got[1], want[1])
+                    else:
+                        self.assertLessEqual(abs(got[1] - want[1]), TOLERANCE, got[0])
+
+if __name__ == "__main__":
+    unittest.main()
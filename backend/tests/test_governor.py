@@ -0,0 +1,32 @@
+"""Query governor regressions."""
+import unittest
+
+import support  # noqa: F401  (must precede backend imports)
+import db
+
+def setUpModule():
+    db.ensure_db()
+    with db.write_conn() as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS Secrets (token TEXT)")
+
+class AuthorizerTest(unittest.TestCase):
+    def test_recursive_cte(self):
+        _, rows = db.run_query("WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x+1 FROM c WHERE x<5) "
+                               "SELECT count(*) FROM c")
+        self.assertEqual(rows, [[5]])
+
+    def test_materialized_cte(self):
+        _, rows = db.run_query("WITH m AS MATERIALIZED (SELECT OrderID FROM Orders) SELECT count(*) FROM m")
+        _, expected = db.run_query("SELECT count(*) FROM Orders")
+        self.assertEqual(rows, expected)
+
+    def test_cte_cannot_reach_other_tables(self):
+        with self.assertRaises(db.QueryNotAllowed):
+            db.run_query("WITH s AS (SELECT token FROM Secrets) SELECT * FROM s")
+
+    def test_unlisted_table(self):
+        with self.assertRaises(db.QueryNotAllowed):
+            db.run_query("SELECT * FROM Secrets")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+"""Incremental ingest and per-table cache invalidation."""
+import sqlite3, unittest
+
+import support  # noqa: F401
+import db, app
+from ingest import ingest, IngestError
+
+PRODUCTS_SQL = "SELECT ProductName FROM Products ORDER BY ProductID"
+ORDERS_SQL = "SELECT COUNT(*) FROM Orders"
+
+def _order(**extra):
+    return {"CustomerID": "ALFKI", "EmployeeID": 1, "OrderDate": "1998-05-06",
+            "lines": [{"ProductID": 1, "UnitPrice": 10.0, "Quantity": 2, "Discount": 0}], **extra}
+
+def _cached(sql: str) -> bool:
+    return app.exec_sql(sql)[4]["cached"]
+
+class IngestTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        db.ensure_db()
+
+    def test_ingest_keeps_cached_results_for_untouched_tables(self):
+        app.exec_sql(PRODUCTS_SQL)
+        before = app.exec_sql(ORDERS_SQL)[1][0][0]
+        self.assertTrue(_cached(ORDERS_SQL))
+        ingest([_order(), _order()])
+        # A new reader re-creates the -wal after the ingest's checkpoint; that is not a change.
+        sqlite3.connect(db.DB_PATH).execute("SELECT 1 FROM Orders LIMIT 1").fetchall()
+        self.assertTrue(_cached(PRODUCTS_SQL))
+        self.assertFalse(_cached(ORDERS_SQL))
+        self.assertEqual(app.exec_sql(ORDERS_SQL)[1][0][0], before + 2)
+
+    def test_order_id_key_is_case_insensitive(self):
+        next_id = app.run_query("SELECT MAX(OrderID) + 1000 FROM Orders")[1][0][0]
+        ingest([_order(orderid=next_id)])
+        _, rows = app.run_query(f"SELECT COUNT(*) FROM OrderDetails WHERE OrderID = {next_id}")
+        self.assertEqual(rows, [[1]])
+
+    def test_invalid_order_writes_nothing(self):
+        _, before = app.run_query(ORDERS_SQL)
+        with self.assertRaises(ValueError):
+            ingest([_order(), _order(), {"Bogus": 1}], batch_size=1)
+        self.assertEqual(app.run_query(ORDERS_SQL)[1], before)
+
+    def test_failed_batch_reports_committed(self):
+        _, before = app.run_query(ORDERS_SQL)
+        taken = app.run_query("SELECT MIN(OrderID) FROM Orders")[1][0][0]
+        with self.assertRaises(IngestError) as ctx:
+            ingest([_order(), _order(OrderID=taken)], batch_size=1)
+        self.assertEqual(ctx.exception.committed["orders"], 1)
+        self.assertEqual(app.run_query(ORDERS_SQL)[1][0][0], before[0][0] + 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,23 @@
+"""Read pool serve modes."""
+import unittest
+
+import support
+import db
+
+class MemoryPoolTest(unittest.TestCase):
+    def test_memory_pool_over_wal_db(self):
+        # Any /ingest or maintenance write leaves the DB in WAL mode.
+        path = support.scratch_copy("wal.sqlite", journal_mode="wal")
+        pool = db.ConnectionPool(path, size=2, mode="memory")
+        try:
+            conn = pool.acquire()
+            try:
+                n = conn.execute("SELECT count(*) FROM Orders").fetchone()[0]
+            finally:
+                pool.release(conn)
+        finally:
+            pool.close()
+        self.assertGreater(n, 0)
+
+if __name__ == "__main__":
+    unittest.main()
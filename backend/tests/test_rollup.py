@@ -0,0 +1,54 @@
+"""SalesRollup vs the base-table templates it stands in for."""
+import sqlite3, unittest
+
+import support  # noqa: F401
+import db, rollup
+from ingest import ingest
+from sqlgen import generate_sql_and_chart
+
+QUESTIONS = ["Monthly sales trend", "Sales share by country", "Sales by category", "Top 3 employees by sales"]
+TOLERANCE = 0.0 if sqlite3.sqlite_version_info >= (3, 43) else 0.01 + 1e-9
+
+def setUpModule():
+    db.ensure_db()
+    with db.tracked_write(["Customers"]), db.write_conn() as conn:
+        conn.execute("INSERT OR IGNORE INTO Customers(CustomerID, CompanyName) VALUES ('NOCTY', 'No Country Ltd')")
+
+def _order(customer: str) -> dict:
+    return {"CustomerID": customer, "EmployeeID": 1, "OrderDate": "1998-05-07",
+            "lines": [{"ProductID": 2, "UnitPrice": 19.0, "Quantity": 3, "Discount": 0}]}
+
+class RollupTest(unittest.TestCase):
+    def assertMatchesBase(self):
+        self.assertTrue(rollup.ensure_fresh())
+        for question in QUESTIONS:
+            with self.subTest(question=question):
+                _, want = db.run_query(generate_sql_and_chart(question)["sql"])
+                _, got = db.run_query(generate_sql_and_chart(question, rollup=True)["sql"])
+                self.assertEqual([r[0] for r in got], [r[0] for r in want])
+                for g, w in zip(got, want):
+                    self.assertLessEqual(abs(g[1] - w[1]), TOLERANCE, g[0])
+
+    def test_null_country_kept_and_unknown_customer_dropped(self):
+        ingest([_order("NOCTY"), _order("NOSUCH")])
+        self.assertMatchesBase()
+        _, rows = db.run_query(generate_sql_and_chart("Sales share by country", rollup=True)["sql"])
+        self.assertIn(None, [r[0] for r in rows])
+
+    def test_change_below_watermark_rebuilds(self):
+        self.assertTrue(rollup.ensure_fresh())
+        with db.tracked_write(["Orders", "OrderDetails"]), db.write_conn() as conn:
+            oldest = conn.execute("SELECT MIN(OrderID) FROM Orders").fetchone()[0]
+            conn.execute("DELETE FROM OrderDetails WHERE OrderID=?", (oldest,))
+            conn.execute("DELETE FROM Orders WHERE OrderID=?", (oldest,))
+        self.assertMatchesBase()
+
+    def test_outdated_rollup_is_rebuilt(self):
+        with db.write_conn() as conn:
+            conn.execute(f"DROP TABLE {rollup.ROLLUP_TABLE}")
+            conn.execute(f"CREATE TABLE {rollup.ROLLUP_TABLE} (month TEXT, country TEXT, revenue REAL)")
+        rollup.refresh()
+        self.assertMatchesBase()
+
+if __name__ == "__main__":
+    unittest.main()
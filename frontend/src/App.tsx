@@ -32,9 +32,12 @@ type ApiReply = {
   chart: ChartSpec;
   insight: string;
   table?: { columns: string[]; rows: any[][] };
-  meta?: { sql: string; elapsed_ms: number; row_count: number; forecast?: boolean; truncated?: boolean; used_llm?: boolean };
+  meta?: { sql: string; elapsed_ms: number; row_count: number; forecast?: boolean; truncated?: boolean; used_llm?: boolean; query_id?: string; next_cursor?: string | null };
 };
-type ChatMessage = { role: "user"; content: string } | { role: "assistant"; reply: ApiReply };
+type ChatMessage = { role: "user"; content: string } | { role: "assistant"; reply: Partial<ApiReply> };
+type StreamEvent = { event: string; data: any };
+
+const API_BASE = (import.meta as any).env?.VITE_API_BASE || "http://localhost:8000";
 
 function cn(...classes: Array<string | false | undefined>) { return classes.filter(Boolean).join(" "); }
 function toCSV(columns: string[], rows: any[][]) {
@@ -48,6 +51,38 @@ function toCSV(columns: string[], rows: any[][]) {
   ).join("\n");
   return header + "\n" + body;
 }
+async function* readNDJSON(res: Response): AsyncGenerator<StreamEvent> {
+  const reader = res.body!.getReader();
+  const decoder = new TextDecoder();
+  let buf = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buf += decoder.decode(value, { stream: true });
+    let nl: number;
+    while ((nl = buf.indexOf("\n")) >= 0) {
+      const line = buf.slice(0, nl).trim();
+      buf = buf.slice(nl + 1);
+      if (line) yield JSON.parse(line);
+    }
+  }
+  if (buf.trim()) yield JSON.parse(buf);
+}
+// Folds one /chat/stream event into the reply rendered so far.
+function applyEvent(reply: Partial<ApiReply>, ev: StreamEvent): Partial<ApiReply> {
+  switch (ev.event) {
+    case "fallback": return {};
+    case "sql": return { ...reply, meta: { ...(reply.meta || { elapsed_ms: 0, row_count: 0 }), sql: ev.data.sql } };
+    case "table": return { ...reply, table: { columns: ev.data.columns, rows: [] } };
+    case "rows": return { ...reply, table: { columns: reply.table?.columns || [], rows: [...(reply.table?.rows || []), ...ev.data] } };
+    case "chart": return { ...reply, chart: ev.data };
+    case "forecast": return reply.chart ? { ...reply, chart: { ...reply.chart, data: [...reply.chart.data, ...ev.data] } } : reply;
+    case "insight": return { ...reply, insight: ev.data };
+    case "meta": return { ...reply, meta: ev.data };
+    case "error": throw new Error(typeof ev.data?.detail === "string" ? ev.data.detail : JSON.stringify(ev.data));
+    default: return reply;
+  }
+}
 const COLORS = ["#2563eb","#10b981","#f59e0b","#ef4444","#8b5cf6","#14b8a6","#f97316","#06b6d4"];
 
 function ChartRenderer({ spec }: { spec: ChartSpec }) {
@@ -151,9 +186,29 @@ function InsightCard({ insight }: { insight: string }) {
   );
 }
 
-function DataAccordion({ table }: { table?: { columns: string[]; rows: any[][] } }) {
+function DataAccordion({ table, meta }: { table?: { columns: string[]; rows: any[][] }; meta?: ApiReply["meta"] }) {
   const [open, setOpen] = useState(false);
+  const [extra, setExtra] = useState<any[][]>([]);
+  const [cursor, setCursor] = useState<string | null | undefined>(undefined);
+  const [paging, setPaging] = useState(false);
   if (!table) return null;
+  const next = cursor === undefined ? meta?.next_cursor : cursor;
+  const rows = extra.length ? table.rows.concat(extra) : table.rows;
+  async function loadMore() {
+    if (!meta?.query_id || !next) return;
+    setPaging(true);
+    try {
+      const res = await fetch(`${API_BASE}/query/${meta.query_id}/rows?cursor=${encodeURIComponent(next)}`);
+      if (!res.ok) throw new Error(`HTTP ${res.status}`);
+      const page = await res.json();
+      setExtra(e => e.concat(page.rows));
+      setCursor(page.next_cursor);
+    } catch {
+      setCursor(null);
+    } finally {
+      setPaging(false);
+    }
+  }
   return (
     <div className="w-full">
       <button onClick={() => setOpen(v => !v)} className="mt-2 w-full flex items-center justify-between px-4 py-3 bg-zinc-50 hover:bg-zinc-100 dark:bg-zinc-900 dark:hover:bg-zinc-800 border border-zinc-200 dark:border-zinc-800 rounded-xl text-left">
@@ -167,13 +222,18 @@ function DataAccordion({ table }: { table?: { columns: string[]; rows: any[][] }
               <tr>{table.columns.map((c, i) => (<th key={i} className="px-3 py-2 text-left font-semibold whitespace-nowrap">{c}</th>))}</tr>
             </thead>
             <tbody>
-              {table.rows.map((r, i) => (
+              {rows.map((r, i) => (
                 <tr key={i} className={i % 2 ? "bg-white dark:bg-zinc-900" : "bg-zinc-50 dark:bg-zinc-950"}>
                   {r.map((v, j) => (<td key={j} className="px-3 py-2 text-zinc-700 dark:text-zinc-200 whitespace-nowrap">{typeof v === "number" ? v.toLocaleString() : String(v)}</td>))}
                 </tr>
               ))}
             </tbody>
           </table>
+          {next && (
+            <button onClick={loadMore} disabled={paging} className="w-full px-4 py-2 text-sm font-medium text-blue-600 dark:text-blue-400 hover:bg-zinc-50 dark:hover:bg-zinc-900 disabled:opacity-50">
+              {paging ? "Loading…" : "Load more rows"}
+            </button>
+          )}
         </div>
       )}
     </div>
@@ -188,13 +248,14 @@ function UserBubble({ text }: { text: string }) {
   );
 }
 
-function AssistantBundle({ reply }: { reply: ApiReply }) {
+function AssistantBundle({ reply }: { reply: Partial<ApiReply> }) {
+  if (!reply.chart) return null;
   return (
     <motion.div initial={{ opacity: 0, y: 8 }} animate={{ opacity: 1, y: 0 }} transition={{ duration: 0.25 }} className="w-full flex justify-start">
       <div className="max-w-[85%] flex flex-col gap-3">
-        <ChartCard reply={reply} />
-        <InsightCard insight={reply.insight} />
-        <DataAccordion table={reply.table} />
+        <ChartCard reply={reply as ApiReply} />
+        {reply.insight && <InsightCard insight={reply.insight} />}
+        <DataAccordion table={reply.table} meta={reply.meta} />
       </div>
     </motion.div>
   );
@@ -205,26 +266,30 @@ export default function App() {
   const [messages, setMessages] = useState<ChatMessage[]>([]);
   const [input, setInput] = useState("");
   const [loading, setLoading] = useState(false);
-  const API_BASE = (import.meta as any).env?.VITE_API_BASE || "http://localhost:8000";
 
   async function send() {
     const q = input.trim();
     if (!q || loading) return;
     setInput("");
-    setMessages(m => [...m, { role: "user", content: q }]);
+    setMessages(m => [...m, { role: "user", content: q }, { role: "assistant", reply: {} }]);
     setLoading(true);
+    // The assistant placeholder is always the last message while this request is in flight.
+    const setReply = (reply: Partial<ApiReply>) => setMessages(m => [...m.slice(0, -1), { role: "assistant", reply }]);
     try {
-      const res = await fetch(`${API_BASE}/chat`, { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ question: q }) });
-      if (!res.ok) throw new Error(await res.text());
-      const data = await res.json();
-      setMessages(m => [...m, { role: "assistant", reply: data }]);
+      const res = await fetch(`${API_BASE}/chat/stream`, { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ question: q }) });
+      if (!res.ok || !res.body) throw new Error(await res.text());
+      let reply: Partial<ApiReply> = {};
+      for await (const ev of readNDJSON(res)) {
+        reply = applyEvent(reply, ev);
+        setReply(reply);
+      }
     } catch (e: any) {
-      setMessages(m => [...m, { role:"assistant", reply: {
+      setReply({
         chart: { kind:"bar", xField:"Message", yField:"Value", data:[{ Message:"Error", Value:1 }], title:"Oops", subtitle:"Backend error" },
         insight: String(e?.message || e),
         table: { columns:["error"], rows:[[String(e?.message || e)]] },
         meta: { sql:"", elapsed_ms:0, row_count:0 }
-      }}]);
+      });
     } finally { setLoading(false); }
   }
 